@@ -4,12 +4,28 @@ from __future__ import (absolute_import, division, print_function,
 import datetime  # For datetime objects
 import os.path  # To manage paths
 import sys  # To find out the script name (in argv[0])
+import logging
 
 # Import the backtrader platform
 import backtrader as bt
 import backtrader.feeds as btfeeds
 
 LOG_PATH = './log/logfile.txt'
+LOG_LEVEL = logging.DEBUG  # INFO drops the per bar 'Close' lines
+
+logger = logging.getLogger(__name__)
+
+
+def setup_logging(level=LOG_LEVEL, logfile=LOG_PATH):
+    ''' Send the log records of this script to console and logfile, records
+    below level are dropped before any formatting'''
+    for handler in (logging.StreamHandler(sys.stdout),
+                    logging.FileHandler(logfile)):
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
 
 # Create a Stratey
 class TestStrategy(bt.Strategy):
@@ -17,13 +33,11 @@ class TestStrategy(bt.Strategy):
         ('maperiod', 15),
     )
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
-        with open(LOG_PATH, 'a') as logfile:
-            logfile.write('%s, %s' % (dt.isoformat(), txt))
-            logfile.write('\n')
+    def log(self, txt, *args, dt=None, level=logging.INFO):
+        ''' Logging function for this strategy, formatted only if enabled'''
+        if logger.isEnabledFor(level):
+            dt = dt or self.datas[0].datetime.date(0)
+            logger.log(level, '%s, ' + txt, dt.isoformat(), *args)
 
     def __init__(self):
         # Keep a reference to the "close" line in the data[0] dataseries
@@ -58,23 +72,23 @@ class TestStrategy(bt.Strategy):
         if order.status in [order.Completed]:
             if order.isbuy():
                 self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                    order.executed.price,
+                    order.executed.value,
+                    order.executed.comm)
 
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
             else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                         order.executed.price,
+                         order.executed.value,
+                         order.executed.comm)
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.log('Order Canceled/Margin/Rejected', level=logging.WARNING)
 
         # Write down: no pending order
         self.order = None
@@ -83,12 +97,12 @@ class TestStrategy(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f',
+                 trade.pnl, trade.pnlcomm)
 
     def next(self):
         # Simply log the closing price of the series from the reference
-        self.log('Close, %.2f' % self.dataclose[0])
+        self.log('Close, %.2f', self.dataclose[0], level=logging.DEBUG)
 
         # Check if an order is pending ... if yes, we cannot send a 2nd one
         if self.order:
@@ -101,7 +115,7 @@ class TestStrategy(bt.Strategy):
             if self.dataclose[0] > self.sma[0]:
 
                 # BUY, BUY, BUY!!! (with all possible default parameters)
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                self.log('BUY CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.buy()
@@ -110,12 +124,14 @@ class TestStrategy(bt.Strategy):
 
             if self.dataclose[0] < self.sma[0]:
                 # SELL, SELL, SELL!!! (with all possible default parameters)
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.log('SELL CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.sell()
 
 if __name__ == '__main__':
+    setup_logging()
+
     # Create a cerebro entity
     cerebro = bt.Cerebro()
 
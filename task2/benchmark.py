@@ -0,0 +1,284 @@
+import gc
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import datetime
+import contextlib
+import subprocess
+import statistics
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+import fastbt
+from datacache import read_ohlcv
+from report import PerformanceReport
+from run import build_cerebro, datadir, logdir
+from strategies.indcache import indicator_cache
+from strategies.SMACross import SMACross
+from strategies.EMACross import EMACross
+from strategies.FWR import FWR
+from strategies.IchimokuStrategy import IchimokuStrat
+from utils import load_script, quiet_strategies
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+TASK1_DATA = os.path.join(BASEDIR, '..', 'task1', 'data',
+                          'BTCUSDT-1h-data.csv')
+
+REPEAT = 3  # runs per case on the stored files, timed by their median
+SYNTHETIC_BARS = (100000,)  # python benchmark.py 1000000 ... for more
+SYNTHETIC_REPEAT = 1
+SEED = 0
+THRESHOLD = 0.2  # compare: slower than base by more than 20% is a regression
+# dropped while timing: the task2 strategies' records and task1's
+QUIET_LOGGERS = ('strategies', 'first_strategy')
+
+
+def strategies():
+    """ Return dict of name -> strategy class of the benchmarked strategies,
+    the task2 ones and task1's TestStrategy
+    """
+    task1 = load_script('first_strategy', os.path.join(
+        BASEDIR, '..', 'task1', 'first-strategy.py'))
+    return {'SMACross': SMACross, 'EMACross': EMACross, 'FWR': FWR,
+            'IchimokuStrat': IchimokuStrat, 'TestStrategy': task1.TestStrategy}
+
+
+def synthetic_bars(n, seed=SEED):
+    """ Return dataframe of n hourly OHLCV bars of a seeded geometric random
+    walk, with the columns of BTC_USDT_1h.csv
+    """
+    rng = np.random.default_rng(seed)
+    close = 7000.0 * np.exp(np.cumsum(rng.normal(0.0, 0.01, n)))
+    open_ = np.append(7000.0, close[:-1])
+    spread = 1.0 + np.abs(rng.normal(0.0, 0.003, (2, n)))
+    volume = rng.lognormal(7.0, 1.0, n)
+    index = pd.date_range('2010-01-01', periods=n, freq='h', name='datetime')
+    return pd.DataFrame({'close': close,
+                         'high': np.maximum(open_, close) * spread[0],
+                         'low': np.minimum(open_, close) / spread[1],
+                         'open': open_, 'volume': volume,
+                         'baseVolume': volume * close}, index=index)
+
+
+def datasets(bars=SYNTHETIC_BARS, tmpdir=None):
+    """ Return list of (name, csv path, dataframe, repeat) of the benchmark
+    data; synthetic ones are written as csv into tmpdir for the load cases
+    """
+    btc = os.path.join(datadir, 'BTC_USDT_1h.csv')
+    result = [('BTC_USDT_1h', btc, read_ohlcv(btc), REPEAT),
+              ('BTCUSDT-1h-data', TASK1_DATA,
+               read_ohlcv(TASK1_DATA, index_col='timestamp'), REPEAT)]
+    for n in bars:
+        data = synthetic_bars(n)
+        csvpath = os.path.join(tmpdir, 'synthetic_{}.csv'.format(n))
+        data.to_csv(csvpath)
+        result.append(('synthetic_{}'.format(n), csvpath, data,
+                       SYNTHETIC_REPEAT))
+    return result
+
+
+def _measure(func, repeat, setup=None):
+    """ Return (list of wall times, last result) of repeat calls of
+    func(setup()), setup excluded from the times
+    """
+    times, result = [], None
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        result = func(arg)
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _row(suite, name, dataset, bars, times, value=None):
+    median = statistics.median(times)
+    return {'suite': suite, 'name': name, 'dataset': dataset, 'bars': bars,
+            'repeat': len(times), 'times': times, 'min': min(times),
+            'median': median,
+            'bars_per_second': bars / median if median else None,
+            'value': value}
+
+
+def _skipped(suite, name, dataset, error):
+    return {'suite': suite, 'name': name, 'dataset': dataset,
+            'skipped': '{}: {}'.format(type(error).__name__, error)}
+
+
+def bench_strategies(data, dataset, repeat):
+    """ Time a cerebro run of every strategy as in the sweeps (no
+    analyzers), with an empty indicator cache, and the numpy kernels of
+    SMACross/EMACross
+    """
+    rows = []
+    with quiet_strategies(QUIET_LOGGERS):
+        for name, strategy in strategies().items():
+            def run(_):
+                indicator_cache.clear()
+                cerebro = build_cerebro(strategy, data, analyzers=False)
+                cerebro.run()
+                return cerebro.broker.getvalue()
+            times, value = _measure(run, repeat)
+            rows.append(_row('strategy', name, dataset, len(data), times,
+                             value))
+    for kind, strategy in fastbt.STRATEGIES.items():
+        times, result = _measure(
+            lambda _: fastbt.run_crossover(data, 10, 20, kind=kind), repeat)
+        rows.append(_row('strategy', 'fastbt.' + strategy.__name__, dataset,
+                         len(data), times, float(result.final_value)))
+    return rows
+
+
+def bench_load(csvpath, dataset, bars, repeat, index_col='datetime'):
+    """ Time parsing the csv and reading its .npy cache
+    """
+    times, _ = _measure(lambda _: pd.read_csv(
+        csvpath, index_col=index_col, parse_dates=True), repeat)
+    rows = [_row('load', 'csv', dataset, bars, times)]
+    read_ohlcv(csvpath, index_col=index_col)  # cache written once
+    times, _ = _measure(lambda _: read_ohlcv(csvpath, index_col=index_col),
+                        repeat)
+    rows.append(_row('load', 'npycache', dataset, bars, times))
+    return rows
+
+
+def bench_cc2bt(data, dataset, repeat):
+    """ Time cc2bt on CryptoCompare shaped rows of data
+    """
+    fetcher = load_script('data_fetcher',
+                           os.path.join(BASEDIR, 'data-fetcher.py'))
+    raw = pd.DataFrame({'time': data.index.asi8 // 10**9,
+                        'close': data['close'].to_numpy(),
+                        'high': data['high'].to_numpy(),
+                        'low': data['low'].to_numpy(),
+                        'open': data['open'].to_numpy(),
+                        'volumefrom': data['volume'].to_numpy(),
+                        'volumeto': data['volume'].to_numpy()})
+    times, _ = _measure(fetcher.cc2bt, repeat, setup=raw.copy)
+    return [_row('cc2bt', 'cc2bt', dataset, len(data), times)]
+
+
+def bench_report(data, dataset, repeat, outputdir):
+    """ Time the HTML and PDF rendering of the report of an IchimokuStrat
+    run; skipped where matplotlib, jinja2 or weasyprint cannot be loaded
+    """
+    cerebro = build_cerebro(IchimokuStrat, data)
+    with quiet_strategies(QUIET_LOGGERS):
+        stratbt = cerebro.run()[0]
+    report = PerformanceReport(stratbt, infilename=dataset,
+                               outputdir=outputdir, user=None, memo=None)
+    rows = []
+    for name, render in (('html', lambda _: report.generate_html()),
+                         ('pdf', lambda _: report.generate_pdf_report())):
+        try:
+            import matplotlib.pyplot as plt
+            plt.switch_backend('Agg')
+            with contextlib.redirect_stdout(io.StringIO()):
+                times, _ = _measure(render, repeat)
+        except (ImportError, OSError) as e:
+            rows.append(_skipped('report', name, dataset, e))
+        else:
+            rows.append(_row('report', name, dataset, len(data), times))
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASEDIR,
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(bars=SYNTHETIC_BARS):
+    """ Run every benchmark and return the results as dict with the meta
+    data of the run (commit, versions, sizes) and one row per case
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for dataset, csvpath, data, repeat in datasets(bars, tmpdir):
+            print('Benchmarking {} ({} bars)'.format(dataset, len(data)))
+            index_col = 'timestamp' if csvpath == TASK1_DATA else 'datetime'
+            results += bench_load(csvpath, dataset, len(data), repeat,
+                                  index_col)
+            results += bench_cc2bt(data, dataset, repeat)
+            results += bench_strategies(data, dataset, repeat)
+        btc = datasets((), tmpdir)[0]
+        results += bench_report(btc[2], btc[0], REPEAT, tmpdir)
+    meta = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backtrader': bt.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'synthetic_bars': list(bars),
+            'seed': SEED}
+    return {'meta': meta, 'results': results}
+
+
+def _key(row):
+    return row['suite'], row['name'], row['dataset']
+
+
+def compare(base, new, threshold=THRESHOLD):
+    """ Return dataframe comparing the median times and values of the cases
+    of two run_benchmarks results, with a regression column set where new is
+    slower than base by more than threshold or its value differs
+    """
+    base_rows = {_key(row): row for row in base['results']}
+    rows = []
+    for row in new['results']:
+        old = base_rows.get(_key(row))
+        if old is None or 'skipped' in row or 'skipped' in old:
+            continue
+        ratio = row['median'] / old['median'] if old['median'] else None
+        changed = (old['value'] is not None and row['value'] is not None
+                   and not np.isclose(old['value'], row['value'],
+                                      rtol=1e-9, atol=0.0))
+        rows.append({'suite': row['suite'], 'name': row['name'],
+                     'dataset': row['dataset'], 'base': old['median'],
+                     'new': row['median'], 'ratio': ratio,
+                     'value_changed': changed,
+                     'regression': changed or (ratio is not None
+                                               and ratio > 1 + threshold)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    # python benchmark.py [bars ...]           run, e.g. 1000000 5000000
+    #                                          synthetic bars, results in
+    #                                          log/benchmark_<commit>.json
+    # python benchmark.py compare base.json new.json
+    #                                          exit status 1 on regressions
+    if sys.argv[1:2] == ['compare']:
+        with open(sys.argv[2]) as f:
+            base = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        table = compare(base, new)
+        print(table.to_string(index=False))
+        sys.exit(int(bool(len(table)) and bool(table['regression'].any())))
+
+    bars = tuple(int(n) for n in sys.argv[1:]) or SYNTHETIC_BARS
+    results = run_benchmarks(bars)
+    table = pd.DataFrame([row for row in results['results']
+                          if 'skipped' not in row])
+    print(table[['suite', 'name', 'dataset', 'bars', 'median',
+                 'bars_per_second']].to_string(index=False))
+    for row in results['results']:
+        if 'skipped' in row:
+            print('Skipped {suite} {name}: {skipped}'.format(**row))
+    commit = results['meta']['commit']
+    outfile = os.path.join(logdir, 'benchmark_{}.json'.format(
+        commit[:8] if commit else time.strftime('%Y%m%d-%H%M%S')))
+    with open(outfile, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('Results written to {}'.format(outfile))
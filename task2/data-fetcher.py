@@ -1,6 +1,11 @@
+import io
 import re
+import sys
 import time
 import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import requests
 import json
@@ -8,22 +13,123 @@ import pandas as pd
 from datetime import datetime
 import numpy as np
 
+from datacache import read_cache, read_ohlcv, write_cache, update_pyramid
+
+
+class TokenBucket():
+    '''Thread safe token bucket rate limiter
+
+        rate: tokens added per second (sustained requests per second)
+        capacity: maximum burst size (default: rate)
+    '''
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''block until a token is available and take it
+        '''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
 
 class CryptoCompareAPI():
 
-    def __init__(self):
+    # statuses worth retrying: throttled or transient server errors
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate_limit=20, max_retries=5, backoff=0.5,
+                 max_backoff=30, timeout=30, pool_size=16):
+        '''
+            rate_limit: max requests per second, shared by all threads
+            max_retries: retries of a failed request before giving up
+            backoff: base delay in seconds of the exponential backoff
+            max_backoff: cap of the backoff delay in seconds
+            timeout: connect/read timeout of a request in seconds
+            pool_size: kept-alive connections, >= concurrent requests
+        '''
         self.url = 'https://min-api.cryptocompare.com/data'
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.limiter = TokenBucket(rate_limit)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._stats = {'requests': 0, 'retries': 0, 'failures': 0,
+                       'latency_total': 0.0, 'latency_max': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _countStats(self, **increments):
+        with self._stats_lock:
+            for k, v in increments.items():
+                self._stats[k] += v
+
+    def getStats(self):
+        '''return request counters and latency (seconds) of this client
+        '''
+        with self._stats_lock:
+            stats = dict(self._stats)
+        latency_total = stats.pop('latency_total')
+        stats['latency_avg'] = latency_total / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def _backoffDelay(self, attempt, response=None):
+        '''exponential backoff with full jitter, honouring Retry-After
+        '''
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return min(self.max_backoff, int(retry_after))
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
 
     def _safeRequest(self, url):
-        while True:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.monotonic()
+            response = None
             try:
-                response = requests.get(url)
-            except Exception as e:
-                print(f'Connection Failed: {e}. Reconnecting...')
-                time.sleep(1)
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
             else:
-                break
-        resp = response.json()
+                latency = time.monotonic() - start
+                self._countStats(requests=1, latency_total=latency)
+                with self._stats_lock:
+                    self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+                if response.status_code in self.RETRY_STATUS:
+                    error = f'HTTP {response.status_code}'
+                else:
+                    resp = response.json()
+                    # CryptoCompare reports exceeded quotas with status 200
+                    if (resp.get('Response') == 'Error'
+                            and 'rate limit' in resp.get('Message', '')):
+                        error = resp['Message']
+                    else:
+                        break
+            if attempt == self.max_retries:
+                self._countStats(failures=1)
+                raise ConnectionError(
+                    f'Request Failed after {attempt} retries: {error}')
+            self._countStats(retries=1)
+            delay = self._backoffDelay(attempt, response)
+            print(f'Request Failed: {error}. Retrying in {delay:.1f}s...')
+            time.sleep(delay)
         if response.status_code != 200:
             raise Exception(resp)
         data = resp['Data']
@@ -65,7 +171,55 @@ class CryptoCompareAPI():
         return base_url
 
 
-    def getHistoData(self, fsym, tsym, freq, e='CCCAGG', start_time=None, end_time=None, limit=None):
+    def _freqSeconds(self, freq):
+        '''return length of one candle of freq ('1m', '2h', '3d') in seconds
+        '''
+        agg = int(re.findall(r"\d+", freq)[0])
+        unit = re.findall(r"[a-z]", freq)[0]
+        seconds = {'m': 60, 'h': 3600, 'd': 86400}
+        if unit not in seconds:
+            raise ValueError('frequency', unit, 'not supported')
+        return agg * seconds[unit]
+
+    def _getHistoPages(self, base_url, freq, start_timestamp, end_timestamp,
+                       max_workers):
+        '''fetch all 2000 candle pages between start_timestamp and
+        end_timestamp with at most max_workers requests in flight
+
+        The toTs of every page is known up front, so the pages are requested
+        together and joined once at the end.
+        '''
+        step = 2000 * self._freqSeconds(freq)
+        to_timestamps = list(range(end_timestamp, start_timestamp, -step))
+        if not to_timestamps:
+            to_timestamps = [end_timestamp]
+
+        def fetch(to_timestamp):
+            query_url = base_url + f'&toTs={to_timestamp}'
+            return pd.DataFrame(self._safeRequest(self.url + query_url))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = list(executor.map(fetch, to_timestamps))
+        # oldest page first
+        pages = [page for page in reversed(pages) if len(page) > 0]
+        if len(pages) == 0:
+            raise Exception(
+                f'No Data Fetched with {self.url + base_url}&toTs={end_timestamp}')
+        df = pd.concat(pages, ignore_index=True)
+        df = df.drop_duplicates(subset='time', keep='first')
+        earliest_timestamp = int(df['time'].iloc[0])
+        if earliest_timestamp > start_timestamp:
+            request_time = datetime.utcfromtimestamp(
+                start_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            earlies_time = datetime.utcfromtimestamp(
+                earliest_timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            print(
+                f"Request from {request_time}. But Available from {earlies_time}")
+        df = df[df['time'] >= start_timestamp]
+        return df.reset_index(drop=True)
+
+    def getHistoData(self, fsym, tsym, freq, e='CCCAGG', start_time=None, end_time=None, limit=None,
+                     max_workers=None):
         """
             fsym: ticker
             tsym: base
@@ -74,26 +228,33 @@ class CryptoCompareAPI():
             end_time: string datetime format
             limit: number of candles
             e: exchange (default:CCCAGG)
+            max_workers: with start_time and end_time, fetch the pages
+                concurrently with at most max_workers requests in flight
         """
         base_url = self._setBaseUrl(fsym, tsym, freq, e)
         if start_time != None and end_time != None and limit == None:
             base_url += f'&limit={2000}'
             start_timestamp = int(pd.to_datetime(start_time).timestamp())
             end_timestamp = int(pd.to_datetime(end_time).timestamp())
+            if max_workers is not None and max_workers > 1:
+                return self._getHistoPages(base_url, freq, start_timestamp,
+                                           end_timestamp, max_workers)
             query_url = base_url + f'&toTs={end_timestamp}'
             df = pd.DataFrame(self._safeRequest(self.url+query_url))
             if len(df) == 0:
                 raise Exception(f'No Data Fetched with {self.url + query_url}')
+            # newest page first, joined once at the end
+            pages = [df]
             while True:
-                earliest_timestamp = df.iloc[0]['time']
+                earliest_timestamp = int(pages[-1]['time'].iloc[0])
                 if earliest_timestamp <= start_timestamp:
-                    df = df[df['time'] >= start_timestamp]
                     break
                 else:
                     query_url = base_url + f'&toTs={earliest_timestamp}'
                     query_df = pd.DataFrame(
                         self._safeRequest(self.url + query_url))
-                    if len(query_df) == 0:
+                    if (len(query_df) == 0
+                            or query_df['time'].iloc[0] >= earliest_timestamp):
                         request_time = datetime.utcfromtimestamp(
                             start_timestamp).strftime('%Y-%m-%d %H:%M:%S')
                         earlies_time = datetime.utcfromtimestamp(
@@ -102,8 +263,12 @@ class CryptoCompareAPI():
                             f"Request from {request_time}. But Available from {earlies_time}")
                         break
                     else:
-                        df = query_df.append(df.iloc[1:], ignore_index=True)
-            return df
+                        # drop the boundary candle, the older page has it too
+                        pages[-1] = pages[-1].iloc[1:]
+                        pages.append(query_df)
+            df = pd.concat(reversed(pages), ignore_index=True)
+            df = df[df['time'] >= start_timestamp]
+            return df.reset_index(drop=True)
         elif end_time != None and limit != None and start_time == None:
             end_timestamp = int(pd.to_datetime(end_time).timestamp())
             base_url += f'&limit={limit}'  # limit
@@ -197,7 +362,14 @@ class CryptoCompareAPI():
         
 
 
-def unix2date(unix, fmt="%Y-%m-%d %H:%M:%S"):
+# datetime format of the csv files, as written by unix2date and to_csv
+DATE_FMT = "%Y-%m-%d %H:%M:%S"
+
+# first candle synced into a csv without data rows, before any history
+HISTORY_START = "2010-01-01"
+
+
+def unix2date(unix, fmt=DATE_FMT):
     """
         Convert unix epoch time 1562554800 to
         datetime with format
@@ -216,9 +388,12 @@ def date2unxi(date, fmt="%Y-%m-%d %H:%M:%S"):
 
 def cc2bt(df):
     """Convert CryptoCompare data to Backtrader data
+
+        The datetime column is datetime64[ns] (UTC), converted from the epoch
+        seconds in one vectorized step; to_csv(date_format=DATE_FMT) writes
+        it as unix2date would.
     """
-    df['datetime'] = df['time'].apply(unix2date
-                                      )
+    df['datetime'] = pd.to_datetime(df['time'], unit='s')
     df.drop(columns=['time'], inplace=True)
     df.rename(columns={'volumefrom': 'volume',
                        'volumeto': 'baseVolume'}, inplace=True)
@@ -233,14 +408,128 @@ def topMCapCleanData(df):
     return new_df
 
 
+def readLastRow(csvpath):
+    '''Return the header and the last row of csvpath as lists of fields,
+    reading only the end of the file; the last row is None if the file has
+    no data rows, e.g. after an interrupted first fetch
+    '''
+    with open(csvpath, 'rb') as f:
+        header = f.readline().decode().rstrip('\r\n').split(',')
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return header, None
+            if chunk.strip():
+                break
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b''
+        while pos > 0 and tail.strip().count(b'\n') < 1:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+    last = tail.strip().split(b'\n')[-1].decode().rstrip('\r').split(',')
+    return header, last
+
+
+def syncHistoCsv(cc_api, csvpath, fsym, tsym, freq, e='CCCAGG', max_workers=None,
+                 start_time=HISTORY_START):
+    '''Append the candles closed since the last row of csvpath (written
+    by cc2bt) and return the number of rows appended
+
+    Only the missing range is fetched; candles at or before the stored
+    last one and the still open current candle are dropped. A csvpath
+    with a header but no data rows is filled from start_time on.
+    '''
+    header, last = readLastRow(csvpath)
+    now = int(time.time())
+    if last is None:
+        # no existing data: full fetch, the (stale) cache is rebuilt later
+        last_time = start_time
+        last_timestamp = int(pd.to_datetime(start_time).timestamp()) - 1
+        cached = None
+    else:
+        last_time = last[header.index('datetime')]
+        last_timestamp = int(pd.to_datetime(last_time).timestamp())
+        cached = read_cache(csvpath)
+
+    df = cc_api.getHistoData(fsym, tsym, freq, e=e, start_time=last_time,
+                             end_time=unix2date(now), max_workers=max_workers)
+    df = df[(df['time'] > last_timestamp)
+            & (df['time'] + cc_api._freqSeconds(freq) <= now)]
+    if len(df) == 0:
+        return 0
+    rows = cc2bt(df.copy())[header].to_csv(header=False, index=False,
+                                            date_format=DATE_FMT)
+    with open(csvpath, 'a') as f:
+        f.write(rows)
+    if cached is not None:
+        # parse the appended rows back as read_ohlcv parses the whole file,
+        # e.g. empty conversionSymbol fields are NaN, not ''
+        new = pd.read_csv(io.StringIO(rows), names=header,
+                          index_col='datetime', parse_dates=True)
+        base = pd.concat([cached, new[cached.columns]])
+        write_cache(base, csvpath)
+        update_pyramid(csvpath, base)
+    return len(df)
+
+
+def fetchTopListHisto(cc_api, toplist, freq, start_time, end_time, outdir,
+                      e='CCCAGG', max_workers=8):
+    '''Fetch history of every FROMSYMBOL/TOSYMBOL pair of toplist (output
+    of topMCapCleanData) and write one <fsym>_<tsym>_<freq>.csv per pair,
+    with its .npy cache, into outdir
+
+    Pairs are fetched concurrently with at most max_workers requests in
+    flight, on top of the rate limit of cc_api. A failing pair does not
+    stop the batch; returns a dataframe with file, rows and error per pair.
+    '''
+    pairs = list(zip(toplist['FROMSYMBOL'], toplist['TOSYMBOL']))
+
+    def fetch(fsym, tsym):
+        df = cc_api.getHistoData(fsym, tsym, freq, e=e,
+                                 start_time=start_time, end_time=end_time)
+        df = cc2bt(df)
+        csvpath = os.path.join(outdir, f'{fsym}_{tsym}_{freq}.csv')
+        df.to_csv(csvpath, index=False, date_format=DATE_FMT)
+        read_ohlcv(csvpath)  # caches the file as parsed from the CSV
+        return csvpath, len(df)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch, fsym, tsym): (fsym, tsym)
+                   for fsym, tsym in pairs}
+        for future in as_completed(futures):
+            fsym, tsym = futures[future]
+            try:
+                csvpath, rows = future.result()
+            except Exception as e:
+                print(f'{fsym}/{tsym} Failed: {e}')
+                results.append((fsym, tsym, None, 0, str(e)))
+            else:
+                results.append((fsym, tsym, csvpath, rows, None))
+    return pd.DataFrame(results, columns=['FROMSYMBOL', 'TOSYMBOL',
+                                          'file', 'rows', 'error'])
+
+
 if __name__ == "__main__":
     cc_api = CryptoCompareAPI()
     DATA_DIR = './data'
+    csvpath = os.path.join(DATA_DIR, "BTC_USDT_1h.csv")
+
+    if sys.argv[1:] == ['sync']:
+        # incremental update, e.g. from an hourly cron job:
+        #   python data-fetcher.py sync
+        n = syncHistoCsv(cc_api, csvpath, 'BTC', 'USDT', '1h', e='binance')
+        print(f'Appended {n} candles to {csvpath}')
+        sys.exit(0)
 
     df = cc_api.getHistoData('BTC', 'USDT', '1h', start_time="2020-01-01", end_time="2020-04-01", e='binance')
     df = cc2bt(df)
-    with open(os.path.join(DATA_DIR, "BTC_USDT_1h.csv"), 'w') as csv_file:
-      df.to_csv(csv_file, index=False)
+    with open(csvpath, 'w') as csv_file:
+      df.to_csv(csv_file, index=False, date_format=DATE_FMT)
+    read_ohlcv(csvpath)  # caches the file as parsed from the CSV
 
 
     # # case 1: get all coin data
@@ -262,4 +551,9 @@ if __name__ == "__main__":
     # with open(os.path.join(DATA_DIR, 'coin_market_cap_rank20_140.csv'), 'w') as csv_file:
     #     df.to_csv(csv_file)
 
-
+    # # case 4: get 1h candles of the top 120 coins, one file per coin
+    # df = cc_api.getTopListMCap('usd', rank_to=120)
+    # df = topMCapCleanData(df)
+    # res = fetchTopListHisto(cc_api, df, '1h', start_time="2020-01-01",
+    #                         end_time="2020-04-01", outdir=DATA_DIR)
+    # print(res[res['error'].notnull()])
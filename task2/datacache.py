@@ -0,0 +1,225 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+CACHE_SUFFIX = '.npycache'
+META_FILE = 'meta.json'
+INDEX_FILE = '_index.npy'
+
+
+def cache_dir(csvpath):
+    """ Return cache folder of csvpath, e.g. data/BTC_USDT_1h.npycache
+    """
+    return os.path.splitext(csvpath)[0] + CACHE_SUFFIX
+
+
+def _csv_stamp(csvpath):
+    """ Return (mtime_ns, size) of csvpath, None if it does not exist
+    """
+    if not os.path.isfile(csvpath):
+        return None
+    st = os.stat(csvpath)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _write_columns(folder, data, meta):
+    """ Write the columns of datetime indexed dataframe data as one .npy
+    per column (index as int64 epoch ns) into folder, with meta.json
+    holding meta and the column names
+
+    Text columns (e.g. conversionType of CryptoCompare data) are stored as
+    fixed width unicode with a .na.npy mask of their missing values, so no
+    file needs pickle.
+    """
+    os.makedirs(folder, exist_ok=True)
+    # invalidate first, so an interrupted write is never read back
+    metafile = os.path.join(folder, META_FILE)
+    if os.path.exists(metafile):
+        os.remove(metafile)
+    np.save(os.path.join(folder, INDEX_FILE),
+            pd.DatetimeIndex(data.index).asi8)
+    text = [col for col in data.columns if data[col].dtype == object]
+    for col in data.columns:
+        values = data[col]
+        if col in text:
+            np.save(os.path.join(folder, col + '.na.npy'),
+                    values.isna().to_numpy())
+            values = values.fillna('').astype(str)
+        np.save(os.path.join(folder, col + '.npy'), values.to_numpy(
+            dtype=str if col in text else None), allow_pickle=False)
+    meta = dict(meta, columns=list(data.columns), text=text,
+                index_name=data.index.name or 'datetime')
+    with open(metafile, 'w') as f:
+        json.dump(meta, f)
+
+
+def _read_meta(folder):
+    """ Return the meta.json of folder as dict, None if there is none
+    """
+    metafile = os.path.join(folder, META_FILE)
+    if not os.path.isfile(metafile):
+        return None
+    with open(metafile) as f:
+        return json.load(f)
+
+
+def _read_columns(folder, meta):
+    """ Return dataframe written by _write_columns into folder
+    """
+    index = np.load(os.path.join(folder, INDEX_FILE))
+    index = pd.DatetimeIndex(index.view('datetime64[ns]'),
+                             name=meta['index_name'])
+    columns = {col: np.load(os.path.join(folder, col + '.npy'))
+               for col in meta['columns']}
+    for col in meta.get('text', ()):
+        values = columns[col].astype(object)
+        values[np.load(os.path.join(folder, col + '.na.npy'))] = np.nan
+        columns[col] = values
+    return pd.DataFrame(columns, index=index, columns=meta['columns'])
+
+
+def write_cache(data, csvpath, index_col=None):
+    """ Write the columns of datetime indexed dataframe data as one .npy
+    per column (index as int64 epoch ns) into the cache folder of csvpath
+
+    index_col: column holding the datetimes if data is not indexed by them
+    """
+    if index_col is not None:
+        data = data.set_index(index_col)
+        data.index = pd.to_datetime(data.index)
+    _write_columns(cache_dir(csvpath), data, {'csv': _csv_stamp(csvpath)})
+
+
+def read_cache(csvpath):
+    """ Return dataframe from the cache of csvpath, None if missing or stale
+    """
+    folder = cache_dir(csvpath)
+    meta = _read_meta(folder)
+    if meta is None:
+        return None
+    stamp = _csv_stamp(csvpath)
+    if stamp is not None and stamp != meta['csv']:
+        return None
+    if 'text' not in meta:
+        return None  # written when only numeric columns were kept
+    return _read_columns(folder, meta)
+
+
+def read_ohlcv(csvpath, index_col='datetime'):
+    """ Return datetime indexed dataframe of csvpath, read from its binary
+    cache when fresh, else parsed from the CSV and cached for the next run
+    """
+    data = read_cache(csvpath)
+    if data is None:
+        data = pd.read_csv(csvpath, index_col=index_col, parse_dates=True)
+        write_cache(data, csvpath)
+    return data
+
+
+# coarser bar sizes cached with the base bars of a file, each aggregated
+# from the one before it, e.g. 1h -> 4h -> 1d -> 1w
+PYRAMID = ('4h', '1d', '1w')
+
+# aggregation of the price columns, the other ones (volumes) are summed
+_PRICE_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}
+
+
+def timeframe_delta(timeframe):
+    """ Return length of the bars of timeframe ('4h', '1d', '1w') as
+    pd.Timedelta
+    """
+    return pd.Timedelta(7, 'D') if timeframe == '1w' else pd.Timedelta(timeframe)
+
+
+def aggregate(data, timeframe):
+    """ Return OHLCV dataframe data aggregated into bars of timeframe
+
+    Bars are labelled by their start, as the base bars by their open time;
+    days start at midnight, weeks on Monday. Periods without any base bar
+    are left out, as are non-numeric columns.
+    """
+    rule = 'W-MON' if timeframe == '1w' else timeframe
+    how = {col: _PRICE_AGG.get(col, 'sum')
+           for col in data.select_dtypes('number').columns}
+    bars = data.resample(rule, label='left', closed='left').agg(how)
+    return bars[bars['close'].notna()]
+
+
+def pyramid_dir(csvpath, timeframe):
+    """ Return cache folder of the timeframe bars of csvpath, e.g.
+    data/BTC_USDT_1h.npycache/4h
+    """
+    return os.path.join(cache_dir(csvpath), timeframe)
+
+
+def _source_bar(base, rows):
+    """ Return bar rows - 1 of base as list, its time (epoch ns) followed
+    by its numeric values
+    """
+    values = base.select_dtypes('number').iloc[rows - 1]
+    return [int(base.index[rows - 1].value)] + [float(v) for v in values]
+
+
+def _appended(meta, base, stamp):
+    """ Return True if the csv, now parsed as base and with stamp, only
+    had bars appended since the level with meta was written: the file grew
+    and still starts with the rows it had, down to the same last bar
+    """
+    rows = meta.get('rows')
+    if rows is None or stamp is None or stamp[1] <= meta['csv'][1]:
+        return False
+    if len(base) < rows or int(base.index[0].value) != meta['first']:
+        return False
+    return np.array_equal(_source_bar(base, rows), meta['last'],
+                          equal_nan=True)
+
+
+def update_pyramid(csvpath, base=None):
+    """ Bring the PYRAMID aggregates cached for csvpath up to date and
+    return dict of timeframe -> dataframe
+
+    base: the bars of csvpath, read_ohlcv(csvpath) by default
+
+    The files are appended to (see syncHistoCsv), so only the source bars
+    from the start of the last stored period on, which may have been
+    incomplete, are aggregated again. A level is rebuilt unless the csv
+    grew and its first bar, row count and last bar when the level was
+    written are still found in it, e.g. after the file was rewritten.
+    """
+    if base is None:
+        base = read_ohlcv(csvpath)
+    stamp = _csv_stamp(csvpath)
+    info = {'csv': stamp, 'first': int(base.index[0].value),
+            'rows': len(base), 'last': _source_bar(base, len(base))}
+    source = base
+    levels = {}
+    for timeframe in PYRAMID:
+        folder = pyramid_dir(csvpath, timeframe)
+        meta = _read_meta(folder)
+        if meta is not None and meta['csv'] == stamp and 'rows' in meta:
+            bars = _read_columns(folder, meta)
+        elif meta is not None and _appended(meta, base, stamp):
+            stored = _read_columns(folder, meta)
+            last = stored.index[-1]
+            bars = pd.concat([stored[stored.index < last],
+                              aggregate(source[source.index >= last],
+                                        timeframe)])
+            _write_columns(folder, bars, info)
+        else:
+            bars = aggregate(source, timeframe)
+            _write_columns(folder, bars, info)
+        levels[timeframe] = source = bars
+    return levels
+
+
+def read_timeframe(csvpath, timeframe):
+    """ Return the bars of csvpath aggregated to timeframe, one of PYRAMID,
+    from the cache, brought up to date first if csvpath changed
+    """
+    folder = pyramid_dir(csvpath, timeframe)
+    meta = _read_meta(folder)
+    if meta is not None and meta['csv'] == _csv_stamp(csvpath):
+        return _read_columns(folder, meta)
+    return update_pyramid(csvpath)[timeframe]
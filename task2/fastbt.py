@@ -0,0 +1,182 @@
+import itertools
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from kpi import strategy_trades
+from run import load_data, build_cerebro
+from strategies.SMACross import SMACross
+from strategies.EMACross import EMACross
+from utils import quiet_strategies
+
+STRATEGIES = {'sma': SMACross, 'ema': EMACross}
+
+BacktestResult = namedtuple('BacktestResult',
+                            ['final_value', 'trades', 'equity'])
+
+
+def moving_average(close, period, kind='sma'):
+    """ Return backtrader's SMA or EMA of close as array, NaN before period
+
+    EMA is seeded with the SMA of the first period values, as
+    btind.ExponentialMovingAverage does.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    if len(close) < period:
+        return out
+    csum = np.cumsum(np.insert(close, 0, 0.0))
+    sma = (csum[period:] - csum[:-period]) / period
+    if kind == 'sma':
+        out[period - 1:] = sma
+    elif kind == 'ema':
+        seeded = close[period - 1:].copy()
+        seeded[0] = sma[0]
+        out[period - 1:] = pd.Series(seeded).ewm(
+            alpha=2.0 / (1.0 + period), adjust=False).mean().to_numpy()
+    else:
+        raise ValueError('kind', kind, 'not supported')
+    return out
+
+
+def crossover(fast, slow):
+    """ Return +1 / -1 / 0 array of upward / downward crosses of fast over
+    slow, with the semantics of btind.CrossOver (NonZeroDifference based)
+    """
+    diff = fast - slow
+    valid = ~np.isnan(diff)
+    if not valid.any():
+        return np.zeros(len(diff))
+    # carry the last non zero difference forward, seeded by the first one
+    keep = valid & (diff != 0)
+    keep[np.argmax(valid)] = True
+    idx = np.where(keep, np.arange(len(diff)), -1)
+    idx = np.maximum.accumulate(idx)
+    nzd = np.where(idx >= 0, diff[np.maximum(idx, 0)], np.nan)
+    # NaN compares False, so bars before the averages are valid stay 0
+    cross = np.zeros(len(diff))
+    cross[1:] += (nzd[:-1] < 0) & (diff[1:] > 0)
+    cross[1:] -= (nzd[:-1] > 0) & (diff[1:] < 0)
+    return cross
+
+
+def _simulate(open_, close, signal, cash, percents, commission):
+    """ Return final cash, final size, closed trades and the (bar, cash,
+    size) state after every execution; see backtest
+    """
+    # created on the last bar, an order is never executed
+    bars = np.flatnonzero(signal[:-1])
+    size = 0.0
+    trades = []
+    execs = [(-1, cash, 0.0)]
+    for i, sig, price, sigclose in zip(bars.tolist(),
+                                       signal[bars].tolist(),
+                                       open_[bars + 1].tolist(),
+                                       close[bars].tolist()):
+        if size == 0.0 and sig > 0:
+            stake = cash / sigclose * (percents / 100.0)
+            cost = stake * price
+            comm = cost * commission
+            if cash - cost - comm < 0.0:
+                continue
+            cash -= cost + comm
+            size = stake
+            entry = (i + 1, price, comm)
+        elif size != 0.0 and sig < 0:
+            value = size * price
+            comm = value * commission
+            cash += value - comm
+            pnl = size * (price - entry[1])
+            trades.append((entry[0], i + 1, size, entry[1], price,
+                           pnl, pnl - entry[2] - comm))
+            size = 0.0
+        else:
+            continue
+        execs.append((i + 1, cash, size))
+    return cash, size, trades, execs
+
+
+def backtest(open_, close, signal, cash=100000.0, percents=99,
+             commission=0.001):
+    """ Replay the long-only trading of SMACross/EMACross on arrays
+
+    Market orders created on a signal bar fill at the next bar's open,
+    buys are sized like bt.sizers.PercentSizer on the signal bar's close and
+    are rejected (Margin) when cost plus commission exceeds the cash, as in
+    bt.brokers.BackBroker. Only the signal bars are visited.
+    """
+    open_ = np.asarray(open_, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    cash, size, trades, execs = _simulate(open_, close, signal, cash,
+                                          percents, commission)
+    bars, cashes, sizes = (np.array(x) for x in zip(*execs))
+    state = np.searchsorted(bars, np.arange(len(close)), side='right') - 1
+    equity = cashes[state] + sizes[state] * close
+    trades = pd.DataFrame(trades, columns=['entry_bar', 'exit_bar', 'size',
+                                           'entry_price', 'exit_price',
+                                           'pnl', 'pnlcomm'])
+    final_value = cash + size * close[-1] if len(close) else cash
+    return BacktestResult(final_value, trades, equity)
+
+
+def run_crossover(data, pfast, pslow, kind='sma', **broker):
+    """ Return BacktestResult of SMACross (kind='sma') or EMACross
+    (kind='ema') with pfast/pslow on OHLC dataframe data
+    """
+    close = data['close'].to_numpy(dtype=np.float64)
+    signal = crossover(moving_average(close, pfast, kind),
+                       moving_average(close, pslow, kind))
+    return backtest(data['open'].to_numpy(dtype=np.float64), close, signal,
+                    **broker)
+
+
+def screen(data, pfasts, pslows, kind='sma', cash=100000.0, percents=99,
+           commission=0.001):
+    """ Return dataframe with final value and closed trades of every
+    (pfast, pslow) pair, best first; each average is computed once
+    """
+    close = data['close'].to_numpy(dtype=np.float64)
+    open_ = data['open'].to_numpy(dtype=np.float64)
+    averages = {p: moving_average(close, p, kind)
+                for p in set(pfasts) | set(pslows)}
+    rows = []
+    for pfast, pslow in itertools.product(pfasts, pslows):
+        signal = crossover(averages[pfast], averages[pslow])
+        endcash, size, trades, _ = _simulate(open_, close, signal, cash,
+                                             percents, commission)
+        rows.append((pfast, pslow, endcash + size * close[-1], len(trades)))
+    rows = pd.DataFrame(rows, columns=['pfast', 'pslow', 'final_value',
+                                       'trades_closed'])
+    return rows.sort_values('final_value', ascending=False,
+                            ignore_index=True)
+
+
+def check_against_cerebro(data, pfast, pslow, kind='sma'):
+    """ Return (fast, cerebro) final values and closed trade counts of one
+    pair, to validate the kernel against the full backtrader run
+    """
+    res = run_crossover(data, pfast, pslow, kind)
+    cerebro = build_cerebro(STRATEGIES[kind], data, analyzers=False,
+                            pfast=pfast, pslow=pslow)
+    with quiet_strategies():
+        strat = cerebro.run()[0]
+    # TradeAnalyzer has no 'total' entry for a pair without closed trades
+    pnlcomm, _ = strategy_trades(strat)
+    return ((res.final_value, len(res.trades)),
+            (cerebro.broker.getvalue(), len(pnlcomm)))
+
+
+if __name__ == '__main__':
+    data = load_data()
+
+    # validate on a few pairs, then screen the whole grid
+    for kind in ('sma', 'ema'):
+        for pfast, pslow in [(10, 20), (20, 50), (50, 200)]:
+            fast, full = check_against_cerebro(data, pfast, pslow, kind)
+            print('{} {}/{}: fast {:.2f} ({} trades), cerebro {:.2f} '
+                  '({} trades)'.format(kind, pfast, pslow, fast[0], fast[1],
+                                       full[0], full[1]))
+
+    results = screen(data, range(2, 100), range(5, 300), kind='sma')
+    print(results.head(10).to_string(index=False))
@@ -0,0 +1,200 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from recorder import find_recorder, read_equity, read_trades
+
+# periods per year of the sharpe ratio timeframes, as bt.analyzers.SharpeRatio
+RATEFACTORS = {'D': 252, 'W': 52, 'M': 12, 'Y': 1}
+
+
+def sqn2rating(sqn_score):
+    """ Converts sqn_score score to human readable rating
+    See: http://www.vantharp.com/tharp-concepts/sqn.asp
+    """
+    if sqn_score < 1.6:
+        return "Poor"
+    elif sqn_score < 1.9:
+        return "Below average"
+    elif sqn_score < 2.4:
+        return "Average"
+    elif sqn_score < 2.9:
+        return "Good"
+    elif sqn_score < 5.0:
+        return "Excellent"
+    elif sqn_score < 6.9:
+        return "Superb"
+    else:
+        return "Holy Grail"
+
+
+def period_returns(value, index, startcash, timeframe='M'):
+    """ Return array of returns of the broker value per period (D, W, M or Y)
+    of datetime index, as bt.analyzers.TimeReturn
+
+    Each period's last value is compared with the previous period's last
+    value, the first one with startcash.
+    """
+    value = np.asarray(value, dtype=np.float64)
+    period = pd.DatetimeIndex(index).to_period(timeframe).asi8
+    last = np.append(np.flatnonzero(period[1:] != period[:-1]),
+                     len(period) - 1)
+    ends = value[last]
+    return ends / np.append(startcash, ends[:-1]) - 1.0
+
+
+def sharpe_ratio(value, index, startcash, riskfreerate=0.01, timeframe='M'):
+    """ Return non annualized sharpe ratio of the period returns of value,
+    as bt.analyzers.SharpeRatio (convertrate, population stddev)
+    """
+    returns = period_returns(value, index, startcash, timeframe)
+    if not len(returns):
+        return None
+    rate = (1.0 + riskfreerate) ** (1.0 / RATEFACTORS[timeframe]) - 1.0
+    ret_free = returns - rate
+    retdev = ret_free.std()
+    if retdev == 0.0:
+        return None
+    return float(ret_free.mean() / retdev)
+
+
+def max_drawdown(value):
+    """ Return (max money drawdown, max percent drawdown) of broker value,
+    as bt.analyzers.DrawDown
+    """
+    value = np.asarray(value, dtype=np.float64)
+    if not len(value):
+        return 0.0, 0.0
+    peak = np.maximum.accumulate(value)
+    moneydown = peak - value
+    return (float(max(moneydown.max(), 0.0)),
+            float(max((100.0 * moneydown / peak).max(), 0.0)))
+
+
+def sqn(pnlcomm):
+    """ Return system quality number of closed trades' net pnl,
+    as bt.analyzers.SQN
+    """
+    pnlcomm = np.asarray(pnlcomm, dtype=np.float64)
+    if len(pnlcomm) <= 1:
+        return 0
+    stddev = pnlcomm.std()
+    if stddev == 0.0:
+        return None
+    return float(math.sqrt(len(pnlcomm)) * pnlcomm.mean() / stddev)
+
+
+def trade_stats(pnlcomm, nopen=0):
+    """ Return dict of the bt.analyzers.TradeAnalyzer values used by the
+    report, None where no trade closed
+
+    pnlcomm: net pnl of the closed trades
+    nopen: number of trades still open
+    """
+    pnlcomm = np.asarray(pnlcomm, dtype=np.float64)
+    closed = len(pnlcomm)
+    won = pnlcomm[pnlcomm >= 0.0]
+    lost = pnlcomm[pnlcomm < 0.0]
+    stats = {'total': closed + nopen, 'closed': closed,
+             'won': len(won), 'lost': len(lost)}
+    if not closed:
+        return dict(stats, pnl=None, won_pnl=None, lost_pnl=None,
+                    won_average=None, lost_average=None,
+                    won_max=None, lost_max=None)
+    return dict(stats,
+                pnl=float(pnlcomm.sum()),
+                won_pnl=float(won.sum()),
+                lost_pnl=float(lost.sum()),
+                won_average=float(won.sum() / (len(won) or 1.0)),
+                lost_average=float(lost.sum() / (len(lost) or 1.0)),
+                # max starts from 0.0 in TradeAnalyzer
+                won_max=float(max(won.max(initial=0.0), 0.0)),
+                lost_max=float(min(lost.min(initial=0.0), 0.0)))
+
+
+def strategy_trades(stratbt):
+    """ Return (net pnl array of closed trades, number of open trades) of a
+    finished strategy, read from the file of its EquityRecorder if it has
+    one, else from its trade list so no analyzer is needed
+    """
+    recorder = find_recorder(stratbt)
+    if recorder is not None:
+        analysis = recorder.get_analysis()
+        pnlcomm = read_trades(analysis.trades)['pnlcomm'].to_numpy()
+        return pnlcomm, analysis.nopen
+    trades = [trade for data in stratbt._trades.values()
+              for tradeid in data.values() for trade in tradeid]
+    pnlcomm = [trade.pnlcomm for trade in trades if trade.isclosed]
+    nopen = sum(1 for trade in trades if trade.isopen)
+    return np.array(pnlcomm, dtype=np.float64), nopen
+
+
+def performance_stats(value, index, pnlcomm, startcash, nopen=0,
+                      riskfreerate=0.01):
+    """ Return dict with the KPIs of PerformanceReport.get_performance_stats
+    from broker value per bar, its datetime index and the closed trades'
+    net pnl; undefined ratios are None
+    """
+    index = pd.DatetimeIndex(index)
+    trades = trade_stats(pnlcomm, nopen)
+    closed = trades['closed']
+    rpl = trades['pnl'] if closed else 0.0
+    total_return = rpl / startcash
+    bt_period_days = (index[-1] - index[0]).days
+    moneydown, pctdown = max_drawdown(value)
+    sqn_score = sqn(pnlcomm)
+
+    def ratio(x, y):
+        return x / y if x is not None and y else None
+
+    kpi = {# PnL
+           'start_cash': startcash,
+           'rpl': rpl,
+           'result_won_trades': trades['won_pnl'],
+           'result_lost_trades': trades['lost_pnl'],
+           'profit_factor': ratio(trades['won_pnl'], -(trades['lost_pnl'] or 0)),
+           'rpl_per_trade': ratio(rpl, closed),
+           'total_return': 100 * total_return,
+           'annual_return': ((100 * (1 + total_return)**(365.25 / bt_period_days) - 100)
+                             if bt_period_days else None),
+           'max_money_drawdown': moneydown,
+           'max_pct_drawdown': pctdown,
+           # trades
+           'total_number_trades': trades['total'],
+           'trades_closed': closed,
+           'pct_winning': ratio(100 * trades['won'], closed),
+           'pct_losing': ratio(100 * trades['lost'], closed),
+           'avg_money_winning': trades['won_average'],
+           'avg_money_losing': trades['lost_average'],
+           'best_winning_trade': trades['won_max'],
+           'worst_losing_trade': trades['lost_max'],
+           #  performance
+           'sharpe_ratio': sharpe_ratio(value, index, startcash, riskfreerate),
+           'sqn_score': sqn_score,
+           'sqn_human': sqn2rating(sqn_score) if sqn_score is not None else None
+           }
+    return kpi
+
+
+def strategy_equity(stratbt):
+    """ Return datetime indexed broker value series of a finished single
+    data strategy, read from the file of its EquityRecorder if it has one
+    (low memory runs), else from its broker observer
+    """
+    recorder = find_recorder(stratbt)
+    if recorder is not None:
+        return read_equity(recorder.get_analysis().equity)
+    index = stratbt.data._dataname['open'].index
+    value = stratbt.observers.broker.lines.value.array[:len(index)]
+    return pd.Series(np.asarray(value, dtype=np.float64), index=index)
+
+
+def strategy_stats(stratbt, riskfreerate=0.01):
+    """ Return performance_stats of a finished single data strategy from its
+    broker observer and trade list, the analyzers are not used
+    """
+    equity = strategy_equity(stratbt)
+    pnlcomm, nopen = strategy_trades(stratbt)
+    return performance_stats(equity.to_numpy(), equity.index, pnlcomm,
+                             stratbt.broker.startingcash, nopen, riskfreerate)
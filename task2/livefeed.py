@@ -0,0 +1,173 @@
+import os
+import csv
+import sys
+import time
+import queue
+import socket
+import threading
+
+import backtrader as bt
+import pandas as pd
+
+from run import load_data, build_cerebro, datadir, datafile, loglevel
+from utils import setup_logging
+from strategies.FWR import FWR
+from strategies.IchimokuStrategy import IchimokuStrat
+
+STRATEGIES = {'FWR': FWR, 'IchimokuStrat': IchimokuStrat}
+
+# put on the queue by StreamingData.finish() to end the stream
+_END = object()
+
+
+class StreamingData(bt.feed.DataBase):
+    ''' Live data feed of OHLCV bars arriving one by one
+
+    Bars are (datetime, open, high, low, close, volume) tuples handed to
+    put() from any thread, e.g. by tail_csv() or read_socket(); finish()
+    ends the stream (close() would shadow the close line). The bars of the
+    history dataframe are replayed first so indicators are warm when the
+    first live bar comes in. Cerebro runs a live feed in next mode, so each
+    new bar costs one next() of every indicator, analyzer and strategy and
+    none of them is rebuilt.
+
+    Bars not newer than the last one are dropped, so a source may resend
+    the tail of what it already sent.
+    '''
+    params = (
+        ('history', None),
+        ('qcheck', 0.5),  # seconds to wait for a bar before cerebro polls
+    )
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._history = iter(())
+        self._lastdt = None
+        self._live = False
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return not self._queue.empty()
+
+    def put(self, bar):
+        self._queue.put(bar)
+
+    def finish(self):
+        self._queue.put(_END)
+
+    def start(self):
+        super(StreamingData, self).start()
+        if self.p.history is not None:
+            history = self.p.history
+            self._history = zip(
+                history.index.to_pydatetime(), history['open'],
+                history['high'], history['low'], history['close'],
+                history['volume'])
+            self.put_notification(self.DELAYED)
+
+    def _load(self):
+        while True:
+            bar = next(self._history, None)
+            if bar is None:
+                if not self._live:
+                    self._live = True
+                    self.put_notification(self.LIVE)
+                try:
+                    bar = self._queue.get(timeout=self._qcheck)
+                except queue.Empty:
+                    return None  # no bar yet, cerebro will ask again
+                if bar is _END:
+                    return False
+            if self._lastdt is None or bar[0] > self._lastdt:
+                break
+
+        dt, open_, high, low, close, volume = bar
+        self._lastdt = dt
+        self.lines.datetime[0] = bt.date2num(dt)
+        self.lines.open[0] = open_
+        self.lines.high[0] = high
+        self.lines.low[0] = low
+        self.lines.close[0] = close
+        self.lines.volume[0] = volume
+        self.lines.openinterest[0] = 0.0
+        return True
+
+
+def _parse_bar(row):
+    ''' Return bar tuple of a dict with the columns of the data csv files'''
+    return (pd.Timestamp(row['datetime']).to_pydatetime(),
+            float(row['open']), float(row['high']), float(row['low']),
+            float(row['close']), float(row['volume']))
+
+
+def tail_csv(feed, csvpath, poll=1.0):
+    ''' Start a daemon thread putting every row appended to csvpath (e.g.
+    by data-fetcher.py sync) onto feed, and return it
+    '''
+    def follow():
+        with open(csvpath) as f:
+            header = next(csv.reader([f.readline()]))
+            f.seek(0, 2)  # only rows written from now on
+            pending = ''
+            while True:
+                pending += f.readline()
+                if not pending.endswith('\n'):
+                    time.sleep(poll)  # nothing new or a row half written
+                    continue
+                row = next(csv.reader([pending]))
+                pending = ''
+                if row:
+                    feed.put(_parse_bar(dict(zip(header, row))))
+
+    thread = threading.Thread(target=follow, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_socket(feed, host='localhost', port=9999):
+    ''' Start a daemon thread reading bars from a TCP server, one csv line
+    datetime,open,high,low,close,volume per bar, and return it; the feed
+    ends when the server closes the connection
+    '''
+    columns = ['datetime', 'open', 'high', 'low', 'close', 'volume']
+
+    def receive():
+        with socket.create_connection((host, port)) as conn, \
+                conn.makefile('r') as lines:
+            for row in csv.reader(lines):
+                if row:
+                    feed.put(_parse_bar(dict(zip(columns, row))))
+        feed.finish()
+
+    thread = threading.Thread(target=receive, daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    # python livefeed.py FWR tail          paper trade on rows appended to
+    #                                      the data file by data-fetcher sync
+    # python livefeed.py FWR socket 9999   paper trade on bars sent by a
+    #                                      local server
+    strategy_name, source = sys.argv[1], sys.argv[2]
+    listener = setup_logging(loglevel)
+
+    # last weeks of stored bars to warm up the indicators
+    history = load_data(from_datetime='2020-03-01 00:00:00',
+                        to_datetime='2100-01-01 00:00:00')
+    feed = StreamingData(history=history)
+    if source == 'tail':
+        tail_csv(feed, os.path.join(datadir, datafile))
+    else:
+        read_socket(feed, port=int(sys.argv[3]))
+
+    cerebro = build_cerebro(STRATEGIES[strategy_name], feed)
+    print('Starting Portfolio Value: %.2f' % cerebro.broker.getvalue())
+    try:
+        cerebro.run()
+    except KeyboardInterrupt:
+        pass
+    listener.stop()
+    print('Final Portfolio Value: %.2f' % cerebro.broker.getvalue())
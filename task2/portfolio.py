@@ -0,0 +1,172 @@
+import os
+import sys
+
+import backtrader as bt
+import backtrader.feeds as btfeeds
+import numpy as np
+import pandas as pd
+
+from datacache import read_ohlcv
+from kpi import performance_stats, strategy_equity, strategy_trades, \
+    trade_stats
+from results import ResultStore
+from run import (datadir, resultsdb, from_datetime, to_datetime,
+                 loglevel)
+from sweep import STRATEGIES
+from utils import setup_logging
+
+
+def load_portfolio(datafiles, from_datetime=from_datetime,
+                   to_datetime=to_datetime):
+    """ Return dict of data file -> OHLCV dataframe between from_datetime
+    and to_datetime, all reindexed on the union of their datetimes
+
+    A missing bar repeats the last close with no volume, bars before a
+    symbol's first one its first open: flat prices fire no signal, while
+    NaN prices would turn the broker value NaN.
+    """
+    frames = {}
+    for datafile in datafiles:
+        data = read_ohlcv(os.path.join(datadir, datafile))
+        frames[datafile] = data.loc[
+            (data.index >= pd.to_datetime(from_datetime))
+            & (data.index <= pd.to_datetime(to_datetime))]
+    index = pd.DatetimeIndex(sorted(set().union(
+        *(data.index for data in frames.values()))), name='datetime')
+    for datafile, data in frames.items():
+        data = data.reindex(index)
+        close = data['close'].ffill().fillna(data['open'].bfill())
+        for col in ('open', 'high', 'low'):
+            data[col] = data[col].fillna(close)
+        data['close'] = close
+        data['volume'] = data['volume'].fillna(0.0)
+        frames[datafile] = data
+    return frames
+
+
+class _MetaOnFeed(type(bt.Strategy)):
+    ''' Metaclass of the on_feed() classes, hands the strategy its feed only
+    '''
+
+    def donew(cls, *args, **kwargs):
+        # cerebro passes all its datas first, then addstrategy's args
+        ndatas = sum(1 for arg in args if isinstance(arg, bt.AbstractDataBase))
+        args = (args[cls._feed],) + args[ndatas:]
+        return super(_MetaOnFeed, cls).donew(*args, **kwargs)
+
+
+_feed_classes = {}
+
+
+def on_feed(strategy, feed):
+    ''' Return subclass of single data strategy class trading only the
+    feed-th data of cerebro, so one instance per feed shares the broker
+    '''
+    if (strategy, feed) not in _feed_classes:
+        _feed_classes[strategy, feed] = _MetaOnFeed(
+            strategy.__name__, (strategy,), {'_feed': feed})
+    return _feed_classes[strategy, feed]
+
+
+class PortfolioSizer(bt.Sizer):
+    ''' Buy for percents of the portfolio value, at most cashpercents of
+    the cash left, and close the whole position on sells
+
+    With one feed this buys as bt.sizers.PercentSizer does on the cash.
+    '''
+    params = (
+        ('percents', 99),
+        ('cashpercents', 99),  # room left for the commission
+    )
+
+    def _getsizing(self, comminfo, cash, data, isbuy):
+        position = self.broker.getposition(data)
+        if position:
+            return position.size
+        value = min(self.broker.getvalue() * self.p.percents / 100,
+                    cash * self.p.cashpercents / 100)
+        return value / data.close[0]
+
+
+def build_portfolio_cerebro(strategy, frames, per_feed=True, percents=None,
+                            **params):
+    """ Return cerebro with one data feed per dataframe of frames, named by
+    its key, under one broker
+
+    per_feed: run a single data strategy once per feed (see on_feed), else
+              strategy is cross-sectional and gets all feeds as its datas
+    percents: portfolio value bought per position, default 99 / len(frames)
+
+    Strategies, indicators and feeds are each stepped once per bar, so the
+    per bar work grows linearly with the number of feeds. Analyzers are
+    left out, portfolio_stats computes the KPIs after the run.
+    """
+    # stdstats would add DataTrades, indexed by the ids of all the feeds
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.addobserver(bt.observers.Broker)
+    cerebro.addobserver(bt.observers.BuySell)
+    cerebro.addobserver(bt.observers.Trades)
+    for name, data in frames.items():
+        cerebro.adddata(btfeeds.PandasData(dataname=data), name=name)
+    if per_feed:
+        for feed in range(len(frames)):
+            cerebro.addstrategy(on_feed(strategy, feed), **params)
+    else:
+        cerebro.addstrategy(strategy, **params)
+    cerebro.broker.setcash(100000)
+    cerebro.addsizer(PortfolioSizer,
+                     percents=percents or 99 / len(frames))
+    cerebro.broker.setcommission(commission=0.001)
+    return cerebro
+
+
+def portfolio_stats(stratbts, riskfreerate=0.01):
+    """ Return performance_stats of the strategies of one finished portfolio
+    run, from the value of their shared broker and the trades of them all
+    """
+    equity = strategy_equity(stratbts[0])
+    trades = [strategy_trades(st) for st in stratbts]
+    pnlcomm = np.concatenate([pnl for pnl, _ in trades])
+    nopen = sum(n for _, n in trades)
+    return performance_stats(equity.to_numpy(), equity.index, pnlcomm,
+                             stratbts[0].broker.startingcash, nopen,
+                             riskfreerate)
+
+
+def feed_stats(stratbts):
+    """ Return dataframe with the trade_stats of each feed of a finished
+    portfolio run, indexed by feed name
+    """
+    pnls, nopen = {}, {}
+    for st in stratbts:
+        for data, tradeids in st._trades.items():
+            trades = [t for tradeid in tradeids.values() for t in tradeid]
+            pnls.setdefault(data._name, []).extend(
+                t.pnlcomm for t in trades if t.isclosed)
+            nopen[data._name] = nopen.get(data._name, 0) + sum(
+                1 for t in trades if t.isopen)
+    return pd.DataFrame.from_dict(
+        {name: trade_stats(pnl, nopen[name]) for name, pnl in pnls.items()},
+        orient='index')
+
+
+if __name__ == '__main__':
+    # python portfolio.py SMACross BTC_USDT_1h.csv ETH_USDT_1h.csv ...
+    strategy_name, datafiles = sys.argv[1], sys.argv[2:]
+    strategy = STRATEGIES[strategy_name]
+    listener = setup_logging(loglevel)
+
+    frames = load_portfolio(datafiles)
+    cerebro = build_portfolio_cerebro(strategy, frames)
+    print('Starting Portfolio Value: %.2f' % cerebro.broker.getvalue())
+    stratbts = cerebro.run()
+    listener.stop()
+    print('Final Portfolio Value: %.2f' % cerebro.broker.getvalue())
+
+    kpis = portfolio_stats(stratbts)
+    with ResultStore(resultsdb, datadir) as store:
+        store.save('+'.join(datafiles), strategy, None, from_datetime,
+                   to_datetime, cerebro.broker.getvalue(), kpis,
+                   strategy_equity(stratbts[0]))
+    print(pd.Series(kpis).to_string())
+    print(feed_stats(stratbts).to_string())
@@ -0,0 +1,141 @@
+import time
+import json
+import cProfile
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+# methods timed by Profiler.instrument, per class of the objects cerebro
+# creates in run(); the underscored ones are backtrader's per bar drivers:
+# _once computes the indicators of a strategy over the whole feed (runonce),
+# _oncepost / _next run one bar of it, observers and analyzers included
+STRATEGY_METHODS = ('__init__', '_once', '_oncepost', '_next', 'prenext',
+                    'nextstart', 'next', 'notify_order', 'notify_trade',
+                    '_next_observers', '_next_analyzers', 'stop')
+ANALYZER_METHODS = ('__init__', 'next', 'notify_trade', 'stop')
+WRITER_METHODS = ('__init__', 'addvalues', 'next', 'stop')
+CEREBRO_METHODS = ('runstrategies', '_next_writers')
+
+
+class Profiler:
+    """ Wall time and call counts of the phases of a backtest and of the
+    methods of its strategies, analyzers and writers
+
+    Phases are timed with profiler.phase(name) blocks, cerebro internals by
+    instrument(cerebro) before its run. Times of nested entries are included
+    in their parents', e.g. Strategy.next in cerebro.runstrategies.
+
+    enabled: False makes phase and instrument no-ops, so a pipeline can
+             always go through a profiler
+    cprofile: also collect cProfile stats between start() and stop(),
+              written by dump_stats()
+    """
+
+    def __init__(self, enabled=True, cprofile=False):
+        self.enabled = enabled
+        self._stats = defaultdict(lambda: [0, 0.0])  # name: [calls, seconds]
+        self._profile = cProfile.Profile() if enabled and cprofile else None
+
+    def start(self):
+        if self._profile is not None:
+            self._profile.enable()
+
+    def stop(self):
+        if self._profile is not None:
+            self._profile.disable()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def dump_stats(self, filename):
+        """ Write the cProfile stats to filename, for pstats or snakeviz
+        """
+        if self._profile is not None:
+            self._profile.dump_stats(filename)
+
+    def _add(self, name, seconds):
+        stat = self._stats[name]
+        stat[0] += 1
+        stat[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        """ Time the with block as one call of phase name
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - start)
+
+    def _timed(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._add(name, time.perf_counter() - start)
+        return timed
+
+    def _timed_class(self, cls, methods):
+        """ Return subclass of cls timing methods as cls.__name__.method
+        """
+        dct = {name: self._timed('{}.{}'.format(cls.__name__, name),
+                                 getattr(cls, name))
+               for name in methods if hasattr(cls, name)}
+        return type(cls)(cls.__name__, (cls,), dct)
+
+    def instrument(self, cerebro):
+        """ Time the strategies, analyzers, writers and the per bar methods
+        of cerebro in its next run(), call after everything was added
+        """
+        if not self.enabled or getattr(cerebro, '_profiler', None) is self:
+            return cerebro  # timed already, e.g. run again
+        cerebro._profiler = self
+        cerebro.strats = [
+            [(self._timed_class(cls, STRATEGY_METHODS), args, kwargs)
+             for cls, args, kwargs in strats]
+            for strats in cerebro.strats]
+        cerebro.analyzers = [
+            (self._timed_class(cls, ANALYZER_METHODS), args, kwargs)
+            for cls, args, kwargs in cerebro.analyzers]
+        cerebro.writers = [
+            (self._timed_class(cls, WRITER_METHODS), args, kwargs)
+            for cls, args, kwargs in cerebro.writers]
+        for name in CEREBRO_METHODS:
+            setattr(cerebro, name, self._timed('cerebro.' + name,
+                                               getattr(cerebro, name)))
+        for data in cerebro.datas:
+            # preloading reads the whole feed before the first bar
+            data.preload = self._timed('data.preload', data.preload)
+        return cerebro
+
+    def summary(self):
+        """ Return list of dicts with name, calls, seconds and seconds per
+        call of every timed phase and method, slowest first
+        """
+        rows = [{'name': name, 'calls': calls, 'seconds': seconds,
+                 'per_call': seconds / calls}
+                for name, (calls, seconds) in self._stats.items()]
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def frame(self):
+        """ Return summary() as dataframe indexed by name
+        """
+        return pd.DataFrame(self.summary(),
+                            columns=['name', 'calls', 'seconds',
+                                     'per_call']).set_index('name')
+
+    def write_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
@@ -0,0 +1,107 @@
+import datetime
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+# records of the files written by EquityRecorder, datetimes in epoch seconds
+EQUITY_DTYPE = np.dtype([('dt', '<f8'), ('value', '<f8')])
+TRADES_DTYPE = np.dtype([('dt', '<f8'), ('pnl', '<f8'), ('pnlcomm', '<f8'),
+                         ('barlen', '<f8')])
+
+
+class EquityRecorder(bt.Analyzer):
+    ''' Analyzer appending the broker value of every bar and each closed
+    trade to two binary files, out.equity and out.trades
+
+    Meant for runs with cerebro exactbars=1: the broker observer then only
+    keeps the last values, so the equity curve and the trades the report
+    needs are streamed to disk in chunks of chunk records instead.
+    get_analysis() returns the file names and the number of trades left
+    open; read_equity() and read_trades() load the files.
+    '''
+    params = (
+        ('out', None),
+        ('chunk', 4096),
+    )
+
+    def __init__(self):
+        self._equity = np.empty(self.p.chunk, dtype=EQUITY_DTYPE)
+        self._trades = np.empty(self.p.chunk, dtype=TRADES_DTYPE)
+        self._nequity = 0
+        self._ntrades = 0
+        self._open = set()
+        self._files = None
+
+    def start(self):
+        self.rets.equity = self.p.out + '.equity'
+        self.rets.trades = self.p.out + '.trades'
+        self._files = (open(self.rets.equity, 'wb'),
+                       open(self.rets.trades, 'wb'))
+
+    def _seconds(self):
+        return (self.data.datetime.datetime(0) - _EPOCH).total_seconds()
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self._open.add(trade.ref)
+        if not trade.isclosed:
+            return
+        self._open.discard(trade.ref)
+        if self._ntrades == len(self._trades):
+            self._flush()
+        self._trades[self._ntrades] = (self._seconds(), trade.pnl,
+                                       trade.pnlcomm, trade.barlen)
+        self._ntrades += 1
+
+    def next(self):
+        if self._nequity == len(self._equity):
+            self._flush()
+        self._equity[self._nequity] = (self._seconds(),
+                                       self.strategy.broker.getvalue())
+        self._nequity += 1
+
+    def _flush(self):
+        equity, trades = self._files
+        self._equity[:self._nequity].tofile(equity)
+        self._trades[:self._ntrades].tofile(trades)
+        self._nequity = self._ntrades = 0
+
+    def stop(self):
+        self._flush()
+        for f in self._files:
+            f.close()
+        self.rets.nopen = len(self._open)
+
+
+def _index(seconds):
+    return pd.DatetimeIndex(pd.to_datetime(np.rint(seconds * 1e6), unit='us'),
+                            name='datetime')
+
+
+def read_equity(filename):
+    ''' Return datetime indexed broker value series of an .equity file'''
+    records = np.fromfile(filename, dtype=EQUITY_DTYPE)
+    return pd.Series(records['value'], index=_index(records['dt']))
+
+
+def read_trades(filename):
+    ''' Return dataframe of the closed trades of a .trades file, indexed by
+    their closing datetime
+    '''
+    records = np.fromfile(filename, dtype=TRADES_DTYPE)
+    return pd.DataFrame({'pnl': records['pnl'],
+                         'pnlcomm': records['pnlcomm'],
+                         'barlen': records['barlen'].astype(np.int64)},
+                        index=_index(records['dt']))
+
+
+def find_recorder(stratbt):
+    ''' Return the EquityRecorder analyzer of a strategy, None if it has none
+    '''
+    for analyzer in stratbt.analyzers:
+        if isinstance(analyzer, EquityRecorder):
+            return analyzer
+    return None
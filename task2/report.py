@@ -1,11 +1,106 @@
 import backtrader as bt
 import sys
-import matplotlib.pyplot as plt
+import io
 import os
+import base64
+import multiprocessing
 import pandas as pd
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
+from kpi import sqn2rating, strategy_stats, strategy_equity
 from utils import timestamp2str, get_now, dir_exists
+# matplotlib, jinja2 and weasyprint are imported where used, so backtests
+# that only need the KPIs never load them
+
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
+
+# report template of the current generate_pdf_reports worker process
+_worker_template = None
+
+
+def get_template():
+    """ Return the jinja2 template of the report
+    """
+    from jinja2 import Environment, FileSystemLoader
+    env = Environment(loader=FileSystemLoader(BASEDIR))
+    return env.get_template("templates/template.html")
+
+
+def _plot_equity_curve(curve, buynhold):
+    """ Return figure of equity curve against buy & hold, both starting at 100
+    """
+    import matplotlib.pyplot as plt
+    xrnge = [curve.index[0], curve.index[-1]]
+    dotted = pd.Series(data=[100, 100], index=xrnge)
+    fig, ax = plt.subplots(1, 1)
+    ax.set_ylabel('Net Asset Value (start=100)')
+    ax.set_title('Equity curve')
+    _ = curve.plot(kind='line', ax=ax)
+    _ = buynhold.plot(kind='line', ax=ax, color='grey')
+    _ = dotted.plot(kind='line', ax=ax, color='grey', linestyle=':')
+    return fig
+
+
+def _get_periodicity(curve):
+    """ Maps length of curve to appropriate periodiciy for return plot
+    """
+    startdate = curve.index[0]
+    enddate = curve.index[-1]
+    time_interval = enddate - startdate
+    time_interval_days = time_interval.days
+    if time_interval_days > 5 * 365.25:
+        periodicity = ('Yearly', 'Y')
+    elif time_interval_days > 365.25:
+        periodicity = ('Monthly', 'M')
+    elif time_interval_days > 50:
+        periodicity = ('Weekly', '168H')
+    elif time_interval_days > 5:
+        periodicity = ('Daily', '24H')
+    elif time_interval_days > 0.5:
+        periodicity = ('Hourly', 'H')
+    elif time_interval_days > 0.05:
+        periodicity = ('Per 15 Min', '15M')
+    else: periodicity = ('Per minute', '1M')
+    return periodicity
+
+
+def _plot_return_curve(curve):
+    """ Return bar figure of periodic returns of equity curve
+    """
+    import matplotlib.pyplot as plt
+    period = _get_periodicity(curve)
+    values = curve.resample(period[1]).ohlc()['close']
+    # returns = 100 * values.diff().shift(-1) / values
+    returns = 100 * values.diff() / values
+    returns.index = returns.index.date
+    is_positive = returns > 0
+    fig, ax = plt.subplots(1, 1)
+    ax.set_title("{} returns".format(period[0]))
+    ax.set_xlabel("date")
+    ax.set_ylabel("return (%)")
+    _ = returns.plot.bar(color=is_positive.map({True: 'green', False: 'red'}), ax=ax)
+    return fig
+
+
+def _figure_uri(fig):
+    """ Return png data URI of matplotlib figure fig and close the figure
+    """
+    import matplotlib.pyplot as plt
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    plt.close(fig)
+    return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()
+
+
+def render_html(template, data):
+    """ Return HTML text of report data (see PerformanceReport.get_report_data),
+    with its figures embedded as data URIs
+    """
+    fig_equity = _plot_equity_curve(data['equity_curve'], data['buynhold_curve'])
+    fig_return = _plot_return_curve(data['equity_curve'])
+    graphics = {'url_equity_curve': _figure_uri(fig_equity),
+                'url_return_curve': _figure_uri(fig_return)
+                }
+    all_numbers = {**data['header'], **data['kpis'], **graphics}
+    return template.render(all_numbers)
 
 
 class PerformanceReport:
@@ -39,6 +134,9 @@ class PerformanceReport:
         """ Return dict with performace stats for given strategy withing backtest
         """
         st = self.stratbt
+        if 'myTradeAnalysis' not in st.analyzers.getnames():
+            # cerebro run without the report analyzers
+            return strategy_stats(st)
         dt = st.data._dataname['open'].index
         trade_analysis = st.analyzers.myTradeAnalysis.get_analysis()
         rpl = trade_analysis.pnl.net.total
@@ -80,30 +178,13 @@ class PerformanceReport:
     def get_equity_curve(self):
         """ Return series containing equity curve
         """
-        st = self.stratbt
-        dt = st.data._dataname['open'].index
-        value = st.observers.broker.lines[1].array[:len(dt)]
-        curve = pd.Series(data=value, index=dt)
+        curve = strategy_equity(self.stratbt)
         return 100 * curve / curve.iloc[0]
 
     def _sqn2rating(self, sqn_score):
         """ Converts sqn_score score to human readable rating
-        See: http://www.vantharp.com/tharp-concepts/sqn.asp
         """
-        if sqn_score < 1.6:
-            return "Poor"
-        elif sqn_score < 1.9:
-            return "Below average"
-        elif sqn_score < 2.4:
-            return "Average"
-        elif sqn_score < 2.9:
-            return "Good"
-        elif sqn_score < 5.0:
-            return "Excellent"
-        elif sqn_score < 6.9:
-            return "Superb"
-        else:
-            return "Holy Grail"
+        return sqn2rating(sqn_score)
 
     def __str__(self):
         msg = ("*** PnL: ***\n"
@@ -138,83 +219,36 @@ class PerformanceReport:
     def plot_equity_curve(self, fname='equity_curve.png'):
         """ Plots equity curve to png file
         """
-        curve = self.get_equity_curve()
-        buynhold = self.get_buynhold_curve()
-        xrnge = [curve.index[0], curve.index[-1]]
-        dotted = pd.Series(data=[100, 100], index=xrnge)
-        fig, ax = plt.subplots(1, 1)
-        ax.set_ylabel('Net Asset Value (start=100)')
-        ax.set_title('Equity curve')
-        _ = curve.plot(kind='line', ax=ax)
-        _ = buynhold.plot(kind='line', ax=ax, color='grey')
-        _ = dotted.plot(kind='line', ax=ax, color='grey', linestyle=':')
-        return fig
+        return _plot_equity_curve(self.get_equity_curve(),
+                                  self.get_buynhold_curve())
 
     def _get_periodicity(self):
         """ Maps length backtesting interval to appropriate periodiciy for return plot
         """
-        curve = self.get_equity_curve()
-        startdate = curve.index[0]
-        enddate = curve.index[-1]
-        time_interval = enddate - startdate
-        time_interval_days = time_interval.days
-        if time_interval_days > 5 * 365.25:
-            periodicity = ('Yearly', 'Y')
-        elif time_interval_days > 365.25:
-            periodicity = ('Monthly', 'M')
-        elif time_interval_days > 50:
-            periodicity = ('Weekly', '168H')
-        elif time_interval_days > 5:
-            periodicity = ('Daily', '24H')
-        elif time_interval_days > 0.5:
-            periodicity = ('Hourly', 'H')
-        elif time_interval_days > 0.05:
-            periodicity = ('Per 15 Min', '15M')
-        else: periodicity = ('Per minute', '1M')
-        return periodicity
+        return _get_periodicity(self.get_equity_curve())
 
     def plot_return_curve(self, fname='return_curve.png'):
         """ Plots return curve to png file
         """
-        curve = self.get_equity_curve()
-        period = self._get_periodicity()
-        values = curve.resample(period[1]).ohlc()['close']
-        # returns = 100 * values.diff().shift(-1) / values
-        returns = 100 * values.diff() / values
-        returns.index = returns.index.date
-        is_positive = returns > 0
-        fig, ax = plt.subplots(1, 1)
-        ax.set_title("{} returns".format(period[0]))
-        ax.set_xlabel("date")
-        ax.set_ylabel("return (%)")
-        _ = returns.plot.bar(color=is_positive.map({True: 'green', False: 'red'}), ax=ax)
-        return fig
+        return _plot_return_curve(self.get_equity_curve())
+
+    def get_report_data(self):
+        """ Return picklable dict with everything needed to render the report
+        """
+        return {'header': self.get_header_data(),
+                'kpis': self.get_performance_stats(),
+                'equity_curve': self.get_equity_curve(),
+                'buynhold_curve': self.get_buynhold_curve()}
 
     def generate_html(self):
         """ Returns parsed HTML text string for report
         """
-        basedir = os.path.abspath(os.path.dirname(__file__))
-        images = os.path.join(basedir, 'templates')
-        eq_curve = os.path.join(images, 'equity_curve.png')
-        rt_curve = os.path.join(images, 'return_curve.png')
-        fig_equity = self.plot_equity_curve()
-        fig_equity.savefig(eq_curve)
-        fig_return = self.plot_return_curve()
-        fig_return.savefig(rt_curve)
-        env = Environment(loader=FileSystemLoader('.'))
-        template = env.get_template("templates/template.html")
-        header = self.get_header_data()
-        kpis = self.get_performance_stats()
-        graphics = {'url_equity_curve': 'file://' + eq_curve,
-                    'url_return_curve': 'file://' + rt_curve
-                    }
-        all_numbers = {**header, **kpis, **graphics}
-        html_out = template.render(all_numbers)
-        return html_out
+        return render_html(get_template(), self.get_report_data())
 
     def generate_pdf_report(self, filename='report.pdf'):
         """ Returns PDF report with backtest results
         """
+        from weasyprint import HTML
         html = self.generate_html()
         outfile = os.path.join(self.outputdir, filename)
         HTML(string=html).write_pdf(outfile)
@@ -268,11 +302,86 @@ class PerformanceReport:
         return self.stratbt.broker.startingcash
 
 
+def _init_report_worker():
+    """ Load the report template once per worker, figures are never shown
+    """
+    import matplotlib.pyplot as plt
+    global _worker_template
+    plt.switch_backend('Agg')
+    _worker_template = get_template()
+
+
+def _render_report(job):
+    """ Render one report, write it to outfile and return outfile,
+    or return its HTML text when outfile is None
+    """
+    from weasyprint import HTML
+    data, outfile = job
+    html = render_html(_worker_template, data)
+    if outfile is None:
+        return html
+    HTML(string=html).write_pdf(outfile)
+    return outfile
+
+
+def generate_pdf_reports(stratbts, outputdir, filenames=None, infilename=None,
+                         user=None, memo=None, combined=None, processes=None):
+    """ Write PDF reports of many finished strategies and return their paths
+
+    Report data is collected here, figures, HTML and PDFs are rendered in a
+    process pool whose workers load the template once.
+
+    filenames: one PDF name per strategy, default report_<i>.pdf
+    combined: name of a single PDF with all reports, one after the other,
+              written instead of one PDF per strategy. Only the figures and
+              HTML are rendered in the pool then: WeasyPrint lays out every
+              report serially in this process to join their pages, and that
+              layout is most of the time of a PDF, so combined batches are
+              barely faster than generate_pdf_report in a loop.
+    """
+    from weasyprint import HTML
+    if filenames is None:
+        filenames = ['report_{}.pdf'.format(i) for i in range(len(stratbts))]
+    if len(filenames) != len(stratbts):
+        raise ValueError('{} filenames for {} strategies'.format(
+            len(filenames), len(stratbts)))
+    if not stratbts:
+        return []
+    datas = [PerformanceReport(st, infilename=infilename, outputdir=outputdir,
+                               user=user, memo=memo).get_report_data()
+             for st in stratbts]
+    with multiprocessing.Pool(processes=processes,
+                              initializer=_init_report_worker) as pool:
+        if combined is None:
+            jobs = [(data, os.path.join(outputdir, filename))
+                    for data, filename in zip(datas, filenames)]
+            outfiles = pool.map(_render_report, jobs)
+        else:
+            jobs = [(data, None) for data in datas]
+            # serial: documents to join must be laid out in one process
+            documents = [HTML(string=html).render()
+                         for html in pool.map(_render_report, jobs)]
+            pages = [page for doc in documents for page in doc.pages]
+            outfiles = [os.path.join(outputdir, combined)]
+            documents[0].copy(pages).write_pdf(outfiles[0])
+    msg = "See {} for {} report(s) with backtest results."
+    print(msg.format(outputdir, len(outfiles)))
+    return outfiles
+
+
 class Cerebro(bt.Cerebro):
-    def __init__(self, **kwds):
+    def __init__(self, profiler=None, **kwds):
         super().__init__(**kwds)
+        self.profiler = profiler  # profiling.Profiler timing run and report
         self.add_report_analyzers()
 
+    def run(self, **kwargs):
+        if self.profiler is None:
+            return super().run(**kwargs)
+        self.profiler.instrument(self)
+        with self.profiler.phase('cerebro.run'):
+            return super().run(**kwargs)
+
     def add_report_analyzers(self, riskfree=0.01):
             """ Adds performance stats, required for report
             """
@@ -298,4 +407,8 @@ class Cerebro(bt.Cerebro):
         rpt =PerformanceReport(bt, infilename=infilename,
                                outputdir=outputdir, user=user,
                                memo=memo)
-        rpt.generate_pdf_report()
+        if self.profiler is None:
+            rpt.generate_pdf_report()
+        else:
+            with self.profiler.phase('report'):
+                rpt.generate_pdf_report()
@@ -0,0 +1,196 @@
+import os
+import json
+import sqlite3
+import hashlib
+import datetime
+
+import numpy as np
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    datafile TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    from_datetime TEXT NOT NULL,
+    to_datetime TEXT NOT NULL,
+    data_stamp TEXT NOT NULL DEFAULT '',
+    params TEXT NOT NULL,
+    final_value REAL,
+    kpis TEXT NOT NULL,
+    created TEXT NOT NULL,
+    UNIQUE (datafile, strategy, params_hash, from_datetime, to_datetime)
+);
+CREATE INDEX IF NOT EXISTS runs_strategy ON runs (strategy, datafile);
+CREATE TABLE IF NOT EXISTS equity (
+    run_id INTEGER PRIMARY KEY REFERENCES runs (id) ON DELETE CASCADE,
+    dt BLOB NOT NULL,
+    value BLOB NOT NULL
+);
+"""
+
+
+def strategy_params(strategy, params=None):
+    """ Return dict of all params of strategy class, defaults overridden by
+    params, so explicit defaults and omitted ones give the same run key
+    """
+    return {**dict(strategy.params._getitems()), **(params or {})}
+
+
+def params_hash(params):
+    """ Return stable hex digest of params dict
+    """
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _json_default(value):
+    """ Serialize numpy scalars in KPI dicts
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+def data_stamp(datadir, datafile):
+    """ Return text of the (mtime_ns, size) of each file of datafile, files
+    of a portfolio joined by '+', under datadir; null for missing ones
+    """
+    stamps = []
+    for name in datafile.split('+'):
+        path = os.path.join(datadir, name)
+        st = os.stat(path) if os.path.isfile(path) else None
+        stamps.append([st.st_mtime_ns, st.st_size] if st else None)
+    return json.dumps(stamps)
+
+
+class ResultStore:
+    """ SQLite database of finished backtests
+
+    A run is keyed by data file, strategy name, hash of its full params and
+    the from/to datetimes; its KPIs and equity curve are stored with it so
+    repeated configurations can be looked up instead of run again.
+
+    datadir: folder of the data files, whose mtime and size are stored with
+             each run; a lookup after the file changed (e.g. data-fetcher.py
+             sync appended candles) misses, and saving the new run replaces
+             the stale one
+    """
+
+    def __init__(self, filename, datadir='.'):
+        self.filename = filename
+        self.datadir = datadir
+        self.conn = sqlite3.connect(filename)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in
+                   self.conn.execute('PRAGMA table_info(runs)')]
+        if 'data_stamp' not in columns:
+            # stores written before the stamp: their runs never match one
+            with self.conn:
+                self.conn.execute("ALTER TABLE runs ADD COLUMN data_stamp "
+                                  "TEXT NOT NULL DEFAULT ''")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, datafile, strategy, params, from_datetime, to_datetime):
+        params = strategy_params(strategy, params)
+        return (datafile, strategy.__name__, params_hash(params),
+                from_datetime, to_datetime), params
+
+    def save(self, datafile, strategy, params, from_datetime, to_datetime,
+             final_value, kpis, equity=None):
+        """ Store one run, replacing a stored run with the same key, and
+        return its id
+
+        equity: optional datetime indexed series of the broker value
+        """
+        key, params = self._key(datafile, strategy, params, from_datetime,
+                                to_datetime)
+        stamp = data_stamp(self.datadir, datafile)
+        with self.conn:
+            self.conn.execute(
+                'DELETE FROM runs WHERE datafile = ? AND strategy = ? AND '
+                'params_hash = ? AND from_datetime = ? AND to_datetime = ?',
+                key)
+            cur = self.conn.execute(
+                'INSERT INTO runs (datafile, strategy, params_hash, '
+                'from_datetime, to_datetime, data_stamp, params, '
+                'final_value, kpis, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                key + (stamp, json.dumps(params, sort_keys=True, default=str),
+                       final_value,
+                       json.dumps(kpis, default=_json_default),
+                       datetime.datetime.now().isoformat(timespec='seconds')))
+            run_id = cur.lastrowid
+            if equity is not None:
+                self.conn.execute(
+                    'INSERT INTO equity (run_id, dt, value) VALUES (?, ?, ?)',
+                    (run_id,
+                     pd.DatetimeIndex(equity.index).asi8.tobytes(),
+                     np.asarray(equity, dtype=np.float64).tobytes()))
+        return run_id
+
+    def lookup(self, datafile, strategy, params, from_datetime, to_datetime):
+        """ Return dict with id, params, final_value and kpis of the stored
+        run, None if this configuration was not run yet on the current
+        contents of datafile
+        """
+        key, _ = self._key(datafile, strategy, params, from_datetime,
+                           to_datetime)
+        row = self.conn.execute(
+            'SELECT id, params, final_value, kpis FROM runs WHERE '
+            'datafile = ? AND strategy = ? AND params_hash = ? AND '
+            'from_datetime = ? AND to_datetime = ? AND data_stamp = ?',
+            key + (data_stamp(self.datadir, datafile),)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'params': json.loads(row[1]),
+                'final_value': row[2], 'kpis': json.loads(row[3])}
+
+    def equity_curve(self, run_id):
+        """ Return datetime indexed broker value series of run_id, None if
+        it was stored without one
+        """
+        row = self.conn.execute(
+            'SELECT dt, value FROM equity WHERE run_id = ?',
+            (run_id,)).fetchone()
+        if row is None:
+            return None
+        index = pd.DatetimeIndex(
+            np.frombuffer(row[0], dtype=np.int64).view('datetime64[ns]'),
+            name='datetime')
+        return pd.Series(np.frombuffer(row[1], dtype=np.float64).copy(),
+                         index=index)
+
+    def query(self, strategy=None, datafile=None):
+        """ Return dataframe with one row of metadata, params and KPIs per
+        stored run, optionally filtered by strategy name and data file
+        """
+        sql = ('SELECT id, datafile, strategy, from_datetime, to_datetime, '
+               'params, final_value, kpis, created FROM runs')
+        where, args = [], []
+        if strategy is not None:
+            where.append('strategy = ?')
+            args.append(getattr(strategy, '__name__', strategy))
+        if datafile is not None:
+            where.append('datafile = ?')
+            args.append(datafile)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        rows = []
+        for (run_id, dfile, strat, from_dt, to_dt, params, final_value, kpis,
+             created) in self.conn.execute(sql, args):
+            rows.append({'id': run_id, 'datafile': dfile, 'strategy': strat,
+                         'from_datetime': from_dt, 'to_datetime': to_dt,
+                         **json.loads(params), 'final_value': final_value,
+                         **json.loads(kpis), 'created': created})
+        return pd.DataFrame(rows)
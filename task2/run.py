@@ -1,5 +1,6 @@
 import math
 import os
+import logging
 import datetime
 import sys
 
@@ -7,9 +8,15 @@ import backtrader as bt
 import backtrader.feeds as btfeeds
 import backtrader.indicator as btind
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from report import PerformanceReport
+from datacache import read_ohlcv, read_timeframe, timeframe_delta
+from kpi import strategy_stats, strategy_equity
+from profiling import Profiler
+from recorder import EquityRecorder
+from results import ResultStore
+from utils import setup_logging
+from writer import WriterColumnar
 from strategies.SMACross import SMACross
 from strategies.EMACross import EMACross
 from strategies.FWR import FWR
@@ -18,28 +25,79 @@ from strategies.IchimokuStrategy import IchimokuStrat
 datadir = './data'
 logdir = './log'
 reportdir = './report'
+resultsdb = os.path.join(logdir, 'results.sqlite')
 datafile = 'BTC_USDT_1h.csv'
 from_datetime = '2020-01-01 00:00:00'
 to_datetime = '2020-04-01 00:00:00'
+loglevel = logging.INFO  # DEBUG to also log every bar's close
 
-if __name__ == '__main__':
-    # Create a cerebro entity
-    cerebro = bt.Cerebro()
+# backtrader timeframe and compression of the datacache.PYRAMID bar sizes
+BT_TIMEFRAMES = {'4h': (bt.TimeFrame.Minutes, 240),
+                 '1d': (bt.TimeFrame.Days, 1),
+                 '1w': (bt.TimeFrame.Weeks, 1)}
 
-    # Add a strategy
-    cerebro.addstrategy(IchimokuStrat)
 
-    # Feed data
-    data = pd.read_csv(os.path.join(datadir, datafile),
-                       index_col='datetime', parse_dates=True)
+def load_data(datafile=datafile, from_datetime=from_datetime,
+              to_datetime=to_datetime):
+    """ Return OHLCV dataframe of datafile between from_datetime and to_datetime
+    """
+    data = read_ohlcv(os.path.join(datadir, datafile))
     data = data.loc[(data.index >= pd.to_datetime(from_datetime))
                     & (data.index <= pd.to_datetime(to_datetime))]
-    datafeed = btfeeds.PandasData(dataname=data)
+    return data
+
+
+def load_timeframe(timeframe, datafile=datafile, from_datetime=from_datetime,
+                   to_datetime=to_datetime):
+    """ Return the pre-aggregated timeframe bars of datafile, to be fed next
+    to the bars of load_data instead of resampling them in cerebro
+
+    Each bar is stamped with the datetime of the last base bar it spans, so
+    it arrives with the base bar completing it and never earlier; periods
+    not complete between from_datetime and to_datetime are left out.
+    """
+    base = load_data(datafile, from_datetime, to_datetime).index
+    bars = read_timeframe(os.path.join(datadir, datafile), timeframe)
+    step = (base[1:] - base[:-1]).min()  # length of the base bars
+    ends = bars.index + timeframe_delta(timeframe) - step
+    keep = (bars.index >= base[0]) & (ends <= base[-1])
+    bars = bars[keep]
+    bars.index = ends[keep]
+    return bars
+
+
+def build_cerebro(strategy, data, analyzers=True, exactbars=False,
+                  timeframes=None, **params):
+    """ Return cerebro with strategy, data feed, broker settings and the
+    analyzers required by PerformanceReport
+
+    analyzers: False leaves them out, kpi.strategy_stats computes the same
+    KPIs after the run from the broker value and the trade list
+    exactbars: 1 keeps only the bars the indicators need in the line
+    buffers, for long histories; add a recorder.EquityRecorder to keep the
+    equity curve and trades for the KPIs and the report, no plot is possible
+    timeframes: dict of timeframe -> load_timeframe bars, added after data
+    as feeds named by their timeframe, e.g. self.dnames['1d']
+    """
+    # Create a cerebro entity
+    cerebro = bt.Cerebro(exactbars=exactbars)
+
+    # Add a strategy
+    cerebro.addstrategy(strategy, **params)
 
-    # Add the Data Feed to Cerebro
+    # Add the Data Feed to Cerebro, data is a dataframe or a live feed
+    if isinstance(data, bt.AbstractDataBase):
+        datafeed = data
+    else:
+        datafeed = btfeeds.PandasData(dataname=data)
     cerebro.adddata(datafeed)
 
-    # cerebro.resampledata(datafeed, timeframe=bt.TimeFrame.Weeks, compression=1)
+    # coarser bars from the datacache pyramid, rather than resampledata
+    for timeframe, bars in (timeframes or {}).items():
+        tf, compression = BT_TIMEFRAMES[timeframe]
+        cerebro.adddata(btfeeds.PandasData(dataname=bars, timeframe=tf,
+                                           compression=compression),
+                        name=timeframe)
 
     # Set our desired cash start
     cerebro.broker.setcash(100000)
@@ -50,45 +108,107 @@ if __name__ == '__main__':
     # Set the commission
     cerebro.broker.setcommission(commission=0.001)
 
-    # config log file and fig file names
-    params_lst = [str(v)
-                  for k, v in cerebro.strats[0][0][0].params.__dict__.items()
-                  if not k.startswith('_')]
-    resfile = '_'.join([
-        os.path.splitext(datafile)[0],
-        cerebro.strats[0][0][0].__name__,
-        '_'.join(params_lst), from_datetime.split(" ")[0], to_datetime.split(" ")[0]])
-    logfile = resfile + '.csv'
-    cerebro.addwriter(bt.WriterFile, out=os.path.join(
-        logdir, logfile), csv=True)
+    if not analyzers:
+        return cerebro
+
     cerebro.addanalyzer(bt.analyzers.SharpeRatio,
                         _name="mySharpe",
                         timeframe=bt.TimeFrame.Months)
     cerebro.addanalyzer(bt.analyzers.DrawDown,
                         _name="myDrawDown")
-    cerebro.addanalyzer(bt.analyzers.AnnualReturn,
-                        _name="myReturn")
+    if not exactbars:
+        # reads the whole data buffer back in stop()
+        cerebro.addanalyzer(bt.analyzers.AnnualReturn,
+                            _name="myReturn")
     cerebro.addanalyzer(bt.analyzers.TradeAnalyzer,
                         _name="myTradeAnalysis")
     cerebro.addanalyzer(bt.analyzers.SQN,
                         _name="mySqn")
+    return cerebro
+
+
+def get_resfile(cerebro, datafile=datafile, from_datetime=from_datetime,
+                to_datetime=to_datetime):
+    """ Return base name of log and report files for the strategy in cerebro
+    """
+    strategy, _, kwargs = cerebro.strats[0][0]
+    params_lst = [str(kwargs.get(k, v))
+                  for k, v in strategy.params.__dict__.items()
+                  if not k.startswith('_')]
+    return '_'.join([
+        os.path.splitext(datafile)[0],
+        strategy.__name__,
+        '_'.join(params_lst), from_datetime.split(" ")[0], to_datetime.split(" ")[0]])
+
+
+if __name__ == '__main__':
+    # python run.py headless: backtest only, no plot and no PDF report,
+    # matplotlib, jinja2 and weasyprint are then never imported
+    # python run.py lowmem: bounded line buffers, equity curve and trades
+    # streamed to log/ for the report, no plot
+    # python run.py profile: time the phases and strategy methods, summary
+    # in log/<resfile>.profile.json, cProfile stats in log/<resfile>.prof
+    headless = 'headless' in sys.argv[1:]
+    lowmem = 'lowmem' in sys.argv[1:]
+    profile = 'profile' in sys.argv[1:]
+    profiler = Profiler(enabled=profile, cprofile=profile)
+    profiler.start()
+    listener = setup_logging(loglevel)
+
+    # Feed data
+    with profiler.phase('load_data'):
+        data = load_data()
+
+    with profiler.phase('build_cerebro'):
+        cerebro = build_cerebro(IchimokuStrat, data, exactbars=int(lowmem))
+
+    # config log file and fig file names
+    resfile = get_resfile(cerebro)
+    if lowmem:
+        cerebro.addanalyzer(EquityRecorder, out=os.path.join(logdir, resfile))
+    else:
+        # the writer holds every bar's values until the end of the run
+        logfile = resfile + '.npz'
+        cerebro.addwriter(WriterColumnar, out=os.path.join(logdir, logfile))
+    profiler.instrument(cerebro)
 
     # Print out the starting conditions
     print('Starting Portfolio Value: %.2f' % cerebro.broker.getvalue())
 
     # Run over everything
-    cerebro.run()
+    with profiler.phase('cerebro.run'):
+        cerebro.run()
+    listener.stop()
 
     # Print out the final result
     print('Final Portfolio Value: %.2f' % cerebro.broker.getvalue())
 
-    plt.rcParams['figure.figsize'] = [13.8, 10]
-    fig = cerebro.plot(style='candlestick', barup='green', bardown='red')
-    figfile = resfile + '.png'
-    # fig[0][0].savefig(os.path.join(reportdir, figfile), dpi=480)
-
+    # Keep KPIs and equity curve of the run for later lookups
+    strategy, _, kwargs = cerebro.strats[0][0]
     strat = cerebro.runstrats[0][0]
-    reportfile = resfile + '.pdf'
-    PerformanceReport(
-        strat, outputdir=reportdir, infilename=datafile, user='Bowen', memo='').generate_pdf_report(filename=reportfile)
-
+    with profiler.phase('results'), \
+            ResultStore(resultsdb, datadir) as store:
+        store.save(datafile, strategy, kwargs, from_datetime, to_datetime,
+                   cerebro.broker.getvalue(), strategy_stats(strat),
+                   strategy_equity(strat))
+
+    if not headless:
+        if not lowmem:
+            # plotting needs the full line buffers
+            with profiler.phase('plot'):
+                import matplotlib.pyplot as plt
+                plt.rcParams['figure.figsize'] = [13.8, 10]
+                fig = cerebro.plot(style='candlestick', barup='green', bardown='red')
+        figfile = resfile + '.png'
+        # fig[0][0].savefig(os.path.join(reportdir, figfile), dpi=480)
+
+        reportfile = resfile + '.pdf'
+        with profiler.phase('report'):
+            PerformanceReport(
+                strat, outputdir=reportdir, infilename=datafile, user='Bowen', memo='').generate_pdf_report(filename=reportfile)
+
+    profiler.stop()
+    if profile:
+        print(profiler.frame().to_string())
+        profiler.write_json(os.path.join(logdir, resfile + '.profile.json'))
+        profiler.dump_stats(os.path.join(logdir, resfile + '.prof'))
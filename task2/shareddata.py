@@ -0,0 +1,84 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+class SharedOHLCV:
+    """ OHLCV dataframe held in one shared memory block
+
+    The owner process copies the parsed dataframe in once with from_frame()
+    and hands the small, picklable descriptor to worker processes, which
+    attach() to the same block and get a read-only dataframe view of it.
+
+    Block layout: nrows int64 epoch nanoseconds followed by the float64
+    columns, one contiguous row of nrows values per column.
+    """
+
+    def __init__(self, shm, nrows, columns, owner=False):
+        self.shm = shm
+        self.nrows = nrows
+        self.columns = list(columns)
+        self.owner = owner
+
+    @classmethod
+    def from_frame(cls, data):
+        """ Copy the numeric columns of datetime indexed dataframe data into
+        a new shared memory block
+        """
+        data = data.select_dtypes('number')
+        nrows = len(data)
+        if nrows == 0:
+            raise ValueError('Cannot share an empty dataframe')
+        ncols = len(data.columns)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=8 * nrows * (ncols + 1))
+        shared = cls(shm, nrows, data.columns, owner=True)
+        index, values = shared._arrays()
+        index[:] = pd.DatetimeIndex(data.index).asi8
+        values[:] = data.to_numpy(dtype=np.float64).T
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor):
+        """ Attach to the block described by descriptor (see descriptor)
+        """
+        name, nrows, columns = descriptor
+        return cls(shared_memory.SharedMemory(name=name), nrows, columns)
+
+    @property
+    def descriptor(self):
+        """ Return picklable (name, nrows, columns) to pass to workers
+        """
+        return (self.shm.name, self.nrows, self.columns)
+
+    def _arrays(self):
+        """ Return the datetime index and (ncols, nrows) values views
+        """
+        index = np.ndarray((self.nrows,), dtype=np.int64, buffer=self.shm.buf)
+        values = np.ndarray((len(self.columns), self.nrows), dtype=np.float64,
+                            buffer=self.shm.buf, offset=8 * self.nrows)
+        return index, values
+
+    def frame(self):
+        """ Return read-only dataframe backed by the shared block, no copy
+        """
+        index, values = self._arrays()
+        index.flags.writeable = False
+        values.flags.writeable = False
+        dt = pd.DatetimeIndex(index.view('datetime64[ns]'), name='datetime')
+        return pd.DataFrame(values.T, index=dt, columns=self.columns,
+                            copy=False)
+
+    def close(self):
+        """ Detach this process from the block, unlink it if owner
+        """
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
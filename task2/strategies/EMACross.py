@@ -1,12 +1,18 @@
 import datetime  # For datetime objects
 import os.path  # To manage paths
 import sys  # To find out the script name (in argv[0])
+import logging
 
 # Import the backtrader platform
 import backtrader as bt
 import backtrader.feeds as btfeeds
 import backtrader.indicators as btind
 
+from strategies.indcache import cached
+
+logger = logging.getLogger(__name__)
+
+
 # Create a Stratey
 class EMACross(bt.Strategy):
     params = (
@@ -14,10 +20,11 @@ class EMACross(bt.Strategy):
         ('pslow', 20),
     )
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    def log(self, txt, *args, dt=None, level=logging.INFO):
+        ''' Logging function for this strategy, formatted only if enabled'''
+        if logger.isEnabledFor(level):
+            dt = dt or self.datas[0].datetime.date(0)
+            logger.log(level, '%s, ' + txt, dt.isoformat(), *args)
 
     def __init__(self):
         # Keep a reference to the "close" line in the data[0] dataseries
@@ -28,9 +35,9 @@ class EMACross(bt.Strategy):
         self.buyprice = None
         self.buycomm = None
 
-        # Add a MovingAverageSimple indicator
-        self.ema1 = btind.ExponentialMovingAverage(self.datas[0], period=self.p.pfast)
-        self.ema2 = btind.ExponentialMovingAverage(self.datas[0], period=self.p.pslow)
+        # Add a MovingAverageSimple indicator, reused by later runs on the same data
+        self.ema1 = cached(btind.ExponentialMovingAverage)(self.datas[0], period=self.p.pfast)
+        self.ema2 = cached(btind.ExponentialMovingAverage)(self.datas[0], period=self.p.pslow)
         self.crossover = btind.CrossOver(self.ema1, self.ema2)  # crossover signal
 
         
@@ -44,23 +51,23 @@ class EMACross(bt.Strategy):
         if order.status in [order.Completed]:
             if order.isbuy():
                 self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                    order.executed.price,
+                    order.executed.value,
+                    order.executed.comm)
 
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
             else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                         order.executed.price,
+                         order.executed.value,
+                         order.executed.comm)
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.log('Order Canceled/Margin/Rejected', level=logging.WARNING)
 
         # Write down: no pending order
         self.order = None
@@ -69,12 +76,12 @@ class EMACross(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f',
+                 trade.pnl, trade.pnlcomm)
 
     def next(self):
         # Simply log the closing price of the series from the reference
-        self.log('Close, %.2f' % self.dataclose[0])
+        self.log('Close, %.2f', self.dataclose[0], level=logging.DEBUG)
 
         # Check if an order is pending ... if yes, we cannot send a 2nd one
         if self.order:
@@ -87,7 +94,7 @@ class EMACross(bt.Strategy):
             if self.crossover > 0:
 
                 # BUY, BUY, BUY!!! (with all possible default parameters)
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                self.log('BUY CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.buy()
@@ -96,7 +103,7 @@ class EMACross(bt.Strategy):
 
             if self.crossover < 0:
                 # SELL, SELL, SELL!!! (with all possible default parameters)
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.log('SELL CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.sell()
\ No newline at end of file
@@ -1,5 +1,6 @@
 
 import os
+import logging
 import datetime
 import sys
 
@@ -7,7 +8,10 @@ import backtrader as bt
 import backtrader.indicator as btind
 
 import pandas as pd
-import matplotlib.pyplot as plt
+
+from strategies.signals import FWRSignal
+
+logger = logging.getLogger(__name__)
 
 
 class FWR(bt.Strategy):
@@ -15,10 +19,11 @@ class FWR(bt.Strategy):
         ('stop_loss', 0.02),
     )
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    def log(self, txt, *args, dt=None, level=logging.INFO):
+        ''' Logging function for this strategy, formatted only if enabled'''
+        if logger.isEnabledFor(level):
+            dt = dt or self.datas[0].datetime.date(0)
+            logger.log(level, '%s, ' + txt, dt.isoformat(), *args)
 
     def __init__(self):
         # Keep a reference to the "close" line in the data[0] dataseries
@@ -26,6 +31,9 @@ class FWR(bt.Strategy):
         self.datahigh = self.datas[0].high
         self.datalow = self.datas[0].low
 
+        # Four Week Rule signals, vectorized over the whole feed in runonce
+        self.signal = FWRSignal(self.datas[0])
+
         # To keep track of pending orders and buy price/commission
         self.order = None
         self.buyprice = None
@@ -41,23 +49,23 @@ class FWR(bt.Strategy):
         if order.status in [order.Completed]:
             if order.isbuy():
                 self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                    order.executed.price,
+                    order.executed.value,
+                    order.executed.comm)
 
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
             else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                         order.executed.price,
+                         order.executed.value,
+                         order.executed.comm)
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.log('Order Canceled/Margin/Rejected', level=logging.WARNING)
 
         # Write down: no pending order
         self.order = None
@@ -66,32 +74,19 @@ class FWR(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f',
+                 trade.pnl, trade.pnlcomm)
 
     def next(self):
         # Simply log the closing price of the series from the reference
-        self.log('Close, %.2f' % self.dataclose[0])
+        self.log('Close, %.2f', self.dataclose[0], level=logging.DEBUG)
 
         # Check if an order is pending ... if yes, we cannot send a 2nd one
         if self.order:
             return
 
-        self.first_high = self.datahigh[-3] > self.datahigh[-4]
-        self.second_high = self.datahigh[-2] > self.datahigh[-3]
-        self.third_high = self.datahigh[-1] > self.datahigh[-2]
-        self.fourth_high = self.datahigh[0] > self.datahigh[-1]
-
-        self.buysig = (self.datas[0].datetime[0] > self.datas[0].datetime[-4]
-                       ) & self.first_high & self.second_high & self.third_high & self.fourth_high
-
-        self.first_low = self.datalow[-3] < self.datalow[-4]
-        self.second_low = self.datalow[-2] < self.datalow[-3]
-        self.third_low = self.datalow[-1] < self.datalow[-2]
-        self.fourth_low = self.datalow[0] < self.datalow[-1]
-
-        self.sellsig = (self.datas[0].datetime[0] > self.datas[0].datetime[-4]
-                       ) & self.first_low & self.second_low & self.third_low & self.fourth_low
+        self.buysig = self.signal.buy[0] > 0
+        self.sellsig = self.signal.sell[0] > 0
         
         self.stoplosssig = False
 
@@ -102,7 +97,7 @@ class FWR(bt.Strategy):
             if self.buysig:
 
                 # BUY, BUY, BUY!!! (with all possible default parameters)
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                self.log('BUY CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.buy()
@@ -116,7 +111,7 @@ class FWR(bt.Strategy):
 
             if self.sellsig or self.stoplosssig:
                 # SELL, SELL, SELL!!! (with all possible default parameters)
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.log('SELL CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.sell()
@@ -1,6 +1,7 @@
 import datetime  # For datetime objects
 import os.path  # To manage paths
 import sys  # To find out the script name (in argv[0])
+import logging
 
 # Import the backtrader platform
 import backtrader as bt
@@ -8,6 +9,11 @@ import backtrader.indicators as btind
 
 import pandas as pd
 
+from strategies.indcache import cached
+from strategies.signals import IchimokuSignal
+
+logger = logging.getLogger(__name__)
+
 
 # Create a Stratey
 class IchimokuStrat(bt.Strategy):
@@ -20,10 +26,11 @@ class IchimokuStrat(bt.Strategy):
         ('stop_loss', 0.02), # stop loss %
     )
 
-    def log(self, txt, dt=None):
-        ''' Logging function fot this strategy'''
-        dt = dt or self.datas[0].datetime.date(0)
-        print('%s, %s' % (dt.isoformat(), txt))
+    def log(self, txt, *args, dt=None, level=logging.INFO):
+        ''' Logging function for this strategy, formatted only if enabled'''
+        if logger.isEnabledFor(level):
+            dt = dt or self.datas[0].datetime.date(0)
+            logger.log(level, '%s, ' + txt, dt.isoformat(), *args)
 
     def __init__(self):
         # Keep a reference to the "close" line in the data[0] dataseries
@@ -34,8 +41,11 @@ class IchimokuStrat(bt.Strategy):
         self.buyprice = None
         self.buycomm = None
 
-        # Add a ichmoku cloud indicator
-        self.ich_cloud = btind.Ichimoku()
+        # Add a ichmoku cloud indicator, reused by later runs on the same data
+        self.ich_cloud = cached(btind.Ichimoku)()
+
+        # cloud signals, vectorized over the whole feed in runonce
+        self.signal = IchimokuSignal(self.datas[0], self.ich_cloud)
 
     def notify_order(self, order):
         if order.status in [order.Submitted, order.Accepted]:
@@ -47,23 +57,23 @@ class IchimokuStrat(bt.Strategy):
         if order.status in [order.Completed]:
             if order.isbuy():
                 self.log(
-                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                    (order.executed.price,
-                     order.executed.value,
-                     order.executed.comm))
+                    'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                    order.executed.price,
+                    order.executed.value,
+                    order.executed.comm)
 
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
             else:  # Sell
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
+                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f',
+                         order.executed.price,
+                         order.executed.value,
+                         order.executed.comm)
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.log('Order Canceled/Margin/Rejected', level=logging.WARNING)
 
         # Write down: no pending order
         self.order = None
@@ -72,22 +82,20 @@ class IchimokuStrat(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f',
+                 trade.pnl, trade.pnlcomm)
 
     def next(self):
         # Simply log the closing price of the series from the reference
-        self.log('Close, %.2f' % self.dataclose[0])
+        self.log('Close, %.2f', self.dataclose[0], level=logging.DEBUG)
 
         # Check if an order is pending ... if yes, we cannot send a 2nd one
         if self.order:
             return
 
-        self.buysig = (self.dataclose[0] > self.ich_cloud.senkou_span_b[0]) & (
-            self.ich_cloud.senkou_span_a[0] > self.ich_cloud.senkou_span_b[0]) & (self.dataclose[0] > self.ich_cloud.kijun_sen[0])
+        self.buysig = self.signal.buy[0] > 0
 
-        self.sellsig = (self.dataclose[0] < self.ich_cloud.senkou_span_a[0]) & (
-            self.ich_cloud.senkou_span_a[0] < self.ich_cloud.senkou_span_b[0]) & (self.dataclose[0] < self.ich_cloud.kijun_sen[0])
+        self.sellsig = self.signal.sell[0] > 0
 
         self.stoploss = False
         
@@ -99,7 +107,7 @@ class IchimokuStrat(bt.Strategy):
             if self.buysig:
 
                 # BUY, BUY, BUY!!! (with all possible default parameters)
-                self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                self.log('BUY CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.buy()
@@ -113,7 +121,7 @@ class IchimokuStrat(bt.Strategy):
 
             if self.sellsig or self.stoploss:
                 # SELL, SELL, SELL!!! (with all possible default parameters)
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.log('SELL CREATE, %.2f', self.dataclose[0])
 
                 # Keep track of the created order to avoid a 2nd order
                 self.order = self.sell()
@@ -0,0 +1,164 @@
+import hashlib
+from collections import OrderedDict
+
+# Import the backtrader platform
+import backtrader as bt
+
+import numpy as np
+
+from strategies.signals import _lineview, _setline
+
+
+class IndicatorCache:
+    ''' LRU store of computed indicator lines, bounded by a memory budget
+
+    Keys are (indicator class, params, fingerprints of its input datas),
+    values the minperiod and the float64 array of each line. The least recently
+    used entries are evicted once the arrays exceed maxbytes.
+    '''
+
+    def __init__(self, maxbytes=256 * 2**20):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, minperiods, arrays):
+        size = sum(a.nbytes for a in arrays)
+        if size > self.maxbytes:
+            return
+        if key in self._entries:
+            self.nbytes -= sum(a.nbytes for a in self._entries.pop(key)[1])
+        self._entries[key] = (minperiods, arrays)
+        self.nbytes += size
+        while self.nbytes > self.maxbytes:
+            _, (_, old) = self._entries.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in old)
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# cache of the current process, shared by every cerebro run in it
+indicator_cache = IndicatorCache()
+
+
+def _fingerprint(data):
+    ''' Return digest of the values of a loaded data feed or line, None if
+    its values are not all there yet (an indicator, a live feed)
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    for line in data.lines:
+        if not len(line.array):
+            return None
+        digest.update(line.array)
+    return digest.hexdigest()
+
+
+def _runonce(indicator):
+    ''' Return True if the cerebro creating indicator computes it with
+    once() over the whole preloaded feed
+    '''
+    strategy = bt.metabase.findowner(indicator, bt.Strategy)
+    cerebro = getattr(strategy, 'env', None)
+    return bool(cerebro is not None and cerebro._dopreload
+                and cerebro._dorunonce)
+
+
+class _CachedMethods(object):
+    ''' Methods of the classes returned by cached(), filling the lines of
+    the indicator from indicator_cache
+
+    On a miss the wrapped indicator runs as a sub-indicator and its lines
+    are copied and stored once computed over the whole feed (runonce).
+    Without runonce the cache is not used at all: bar by bar, lines looking
+    ahead (e.g. Ichimoku's chikou_span) are NaN where once() has values.
+    '''
+
+    def __init__(self):
+        fingerprints = tuple(_fingerprint(d) for d in self.datas)
+        self._key = None
+        self._arrays = None
+        self._inner = None
+        if None not in fingerprints and _runonce(self):
+            self._key = (self._indcls, tuple(self.p._getkwargs().items()),
+                         fingerprints)
+            entry = indicator_cache.get(self._key)
+            if entry is not None:
+                minperiods, self._arrays = entry
+                self._setminperiods(minperiods)
+                return
+        self._inner = self._indcls(*self.datas, **self.p._getkwargs())
+        self._setminperiods([line._minperiod for line in self._inner.lines])
+
+    def _setminperiods(self, minperiods):
+        # consumers of the lines wait as long as for the wrapped indicator
+        for line, minperiod in zip(self.lines, minperiods):
+            line.updateminperiod(minperiod)
+
+    def _copy(self, start, end):
+        for i, line in enumerate(self.lines):
+            if self._arrays is not None:
+                values = self._arrays[i][start:end]
+            else:
+                values = _lineview(self._inner.lines[i], start, end)
+            _setline(line, start, end, values)
+
+    def preonce(self, start, end):
+        self._copy(start, end)
+
+    def oncestart(self, start, end):
+        self._copy(start, end)
+
+    def once(self, start, end):
+        self._copy(start, end)
+        if self._arrays is None and self._key is not None \
+                and end == self.buflen():
+            self._arrays = [_lineview(line, 0, end).copy()
+                            for line in self._inner.lines]
+            indicator_cache.put(self._key,
+                                [line._minperiod for line in self.lines],
+                                self._arrays)
+
+    def next(self):
+        for i, line in enumerate(self.lines):
+            if self._arrays is not None:
+                line[0] = self._arrays[i][len(self) - 1]
+            else:
+                line[0] = self._inner.lines[i][0]
+
+    prenext = nextstart = next
+
+
+_cached_classes = {}
+
+
+def cached(indcls):
+    ''' Return subclass of indicator class indcls whose lines are reused
+    from indicator_cache when the same indicator, params and input data
+    were computed before in this process, e.g.
+    cached(btind.SMA)(self.data, period=20)
+    '''
+    if indcls not in _cached_classes:
+        # copied into the class body rather than mixed in, a second base
+        # would make backtrader add the lines of indcls twice
+        methods = {k: v for k, v in vars(_CachedMethods).items()
+                   if k == '__init__' or not k.startswith('__')}
+        _cached_classes[indcls] = type(indcls)(
+            'Cached' + indcls.__name__, (indcls,),
+            dict(methods, _indcls=indcls))
+    return _cached_classes[indcls]
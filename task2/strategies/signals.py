@@ -0,0 +1,101 @@
+from array import array
+
+# Import the backtrader platform
+import backtrader as bt
+
+import numpy as np
+
+
+def _lineview(line, start, end):
+    ''' Return numpy view of line values in [start, end), no copy'''
+    return np.frombuffer(line.array, dtype=np.float64)[start:end]
+
+
+def _setline(line, start, end, values):
+    ''' Write numpy values into line for bars [start, end)'''
+    line.array[start:end] = array('d', values.astype(np.float64).tobytes())
+
+
+def _four_moves(x, cmp):
+    ''' True where cmp held for the last 4 consecutive bars of x'''
+    moved = np.zeros(len(x), dtype=bool)
+    moved[1:] = cmp(x[1:], x[:-1])
+    out = np.zeros(len(x), dtype=bool)
+    out[4:] = moved[4:] & moved[3:-1] & moved[2:-2] & moved[1:-3]
+    return out
+
+
+class FWRSignal(bt.Indicator):
+    ''' Four Week Rule buy/sell signals of FWR
+
+    buy is 1.0 after 4 consecutive higher highs, sell is 1.0 after 4
+    consecutive lower lows. In runonce mode (cerebro default) both lines are
+    computed in one pass over the whole feed with numpy, next() is the bar by
+    bar equivalent used otherwise.
+    '''
+    lines = ('buy', 'sell')
+    plotinfo = dict(plot=False)
+
+    def next(self):
+        high, low, dt = self.data.high, self.data.low, self.data.datetime
+        if len(self) < 5:
+            self.l.buy[0] = self.l.sell[0] = 0.0
+            return
+        newer = dt[0] > dt[-4]
+        self.l.buy[0] = float(
+            newer and high[-3] > high[-4] and high[-2] > high[-3]
+            and high[-1] > high[-2] and high[0] > high[-1])
+        self.l.sell[0] = float(
+            newer and low[-3] < low[-4] and low[-2] < low[-3]
+            and low[-1] < low[-2] and low[0] < low[-1])
+
+    def qbuffer(self, savemem=0):
+        super(FWRSignal, self).qbuffer(savemem)
+        # next() looks 4 bars back but the signal is 0.0 before, so the
+        # minperiod stays 1; keep the bars in bounded (exactbars) buffers
+        self.data.minbuffer(5)
+
+    def once(self, start, end):
+        high = _lineview(self.data.high, 0, end)
+        low = _lineview(self.data.low, 0, end)
+        dt = _lineview(self.data.datetime, 0, end)
+        newer = np.zeros(end, dtype=bool)
+        newer[4:] = dt[4:] > dt[:-4]
+        buy = newer & _four_moves(high, np.greater)
+        sell = newer & _four_moves(low, np.less)
+        _setline(self.l.buy, start, end, buy[start:end])
+        _setline(self.l.sell, start, end, sell[start:end])
+
+
+class IchimokuSignal(bt.Indicator):
+    ''' Ichimoku cloud buy/sell signals of IchimokuStrat
+
+    datas: the price feed and an Ichimoku indicator on it
+
+    buy is 1.0 when close is above the cloud of a rising (green) kumo and
+    above kijun_sen, sell is 1.0 when close is below the cloud of a falling
+    (red) kumo and below kijun_sen. Computed with numpy over the whole feed
+    in runonce mode, bar by bar otherwise.
+    '''
+    lines = ('buy', 'sell')
+    plotinfo = dict(plot=False)
+
+    def next(self):
+        close = self.data0.close[0]
+        span_a = self.data1.senkou_span_a[0]
+        span_b = self.data1.senkou_span_b[0]
+        kijun = self.data1.kijun_sen[0]
+        self.l.buy[0] = float(
+            (close > span_b) & (span_a > span_b) & (close > kijun))
+        self.l.sell[0] = float(
+            (close < span_a) & (span_a < span_b) & (close < kijun))
+
+    def once(self, start, end):
+        close = _lineview(self.data0.close, start, end)
+        span_a = _lineview(self.data1.senkou_span_a, start, end)
+        span_b = _lineview(self.data1.senkou_span_b, start, end)
+        kijun = _lineview(self.data1.kijun_sen, start, end)
+        buy = (close > span_b) & (span_a > span_b) & (close > kijun)
+        sell = (close < span_a) & (span_a < span_b) & (close < kijun)
+        _setline(self.l.buy, start, end, buy)
+        _setline(self.l.sell, start, end, sell)
@@ -0,0 +1,132 @@
+import os
+import itertools
+import multiprocessing
+
+import pandas as pd
+
+from kpi import strategy_stats, strategy_equity
+from shareddata import SharedOHLCV
+from results import ResultStore
+from run import (load_data, build_cerebro, datadir, datafile, logdir,
+                 resultsdb, from_datetime, to_datetime)
+from strategies.SMACross import SMACross
+from strategies.EMACross import EMACross
+from strategies.FWR import FWR
+from strategies.IchimokuStrategy import IchimokuStrat
+
+STRATEGIES = {
+    'SMACross': SMACross,
+    'EMACross': EMACross,
+    'FWR': FWR,
+    'IchimokuStrat': IchimokuStrat,
+}
+
+# shared data block and its dataframe view in the current worker process
+_worker_shared = None
+_worker_data = None
+
+
+def param_grid(grid):
+    """ Expand dict of param name -> list of values into a list of param dicts
+    """
+    keys = list(grid)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _init_worker(descriptor):
+    """ Attach the worker process to the data block shared by run_sweep
+    """
+    global _worker_shared, _worker_data
+    _worker_shared = SharedOHLCV.attach(descriptor)
+    _worker_data = _worker_shared.frame()
+
+
+def _run_params(job):
+    """ Run one backtest and return its params, a flat dict of params and
+    KPIs and its equity curve
+
+    job: (strategy name, params, window, equity), window is None for the
+    whole shared data or a (from, to) pair of timestamps, to excluded;
+    equity False returns None instead of the curve, which is not pickled
+    back through the pool then
+    """
+    strategy_name, params, window, equity = job
+    data = _worker_data
+    if window is not None:
+        # positional slice of the shared block, a view without copy
+        start, end = data.index.searchsorted(list(window))
+        data = data.iloc[start:end]
+    # KPIs are computed after the run, the per bar analyzers are not needed
+    cerebro = build_cerebro(STRATEGIES[strategy_name], data,
+                            analyzers=False, **params)
+    cerebro.run()
+    row = {'strategy': strategy_name, **params,
+           'final_value': cerebro.broker.getvalue()}
+    strat = cerebro.runstrats[0][0]
+    row.update(strategy_stats(strat))
+    return params, row, strategy_equity(strat) if equity else None
+
+
+def run_sweep(strategy_name, grid, datafile=datafile,
+              from_datetime=from_datetime, to_datetime=to_datetime,
+              processes=None, chunksize=None, store=None):
+    """ Run strategy_name for every combination in grid over a process pool
+    and return a dataframe with one row of params and KPIs per run
+
+    store: ResultStore, combinations already stored are read from it
+    instead of run again, new runs are saved to it
+    """
+    strategy = STRATEGIES[strategy_name]
+    unknown = set(grid) - set(strategy.params._getkeys())
+    if unknown:
+        raise ValueError('{} has no params {}'.format(
+            strategy_name, sorted(unknown)))
+    rows, jobs = [], []
+    for params in param_grid(grid):
+        found = None
+        if store is not None:
+            found = store.lookup(datafile, strategy, params,
+                                 from_datetime, to_datetime)
+        if found is None:
+            jobs.append((strategy_name, params, None, store is not None))
+        else:
+            rows.append({'strategy': strategy_name, **params,
+                         'final_value': found['final_value'],
+                         **found['kpis']})
+    if not jobs:
+        return pd.DataFrame(rows)
+    processes = processes or os.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (4 * processes))
+    # parse once here, workers read the shared block without copying it
+    data = load_data(datafile, from_datetime, to_datetime)
+    with SharedOHLCV.from_frame(data) as shared, \
+            multiprocessing.Pool(processes=processes,
+                                 initializer=_init_worker,
+                                 initargs=(shared.descriptor,)) as pool:
+        for params, row, equity in pool.imap_unordered(_run_params, jobs,
+                                                       chunksize):
+            rows.append(row)
+            if store is not None:
+                kpis = {k: v for k, v in row.items()
+                        if k not in params and k not in ('strategy',
+                                                         'final_value')}
+                store.save(datafile, strategy, params, from_datetime,
+                           to_datetime, row['final_value'], kpis, equity)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    strategy_name = 'SMACross'
+    grid = {'pfast': range(5, 30, 5),
+            'pslow': range(20, 100, 10)}
+
+    with ResultStore(resultsdb, datadir) as store:
+        results = run_sweep(strategy_name, grid, store=store)
+    results = results.sort_values('final_value', ascending=False)
+    resfile = '_'.join([
+        os.path.splitext(datafile)[0], strategy_name, 'sweep',
+        from_datetime.split(" ")[0], to_datetime.split(" ")[0]])
+    results.to_csv(os.path.join(logdir, resfile + '.csv'), index=False)
+    print(results.head(10).to_string(index=False))
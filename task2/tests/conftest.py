@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+TASK2 = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TASK2)
+
+from utils import load_script  # noqa: E402
+
+
+@pytest.fixture
+def fetcher():
+    return load_script('data_fetcher', os.path.join(TASK2, 'data-fetcher.py'))
@@ -0,0 +1,113 @@
+import shutil
+
+import pandas as pd
+
+import pytest
+
+from datacache import (PYRAMID, aggregate, cache_dir, read_cache, read_ohlcv,
+                       read_timeframe, write_cache)
+
+HOUR = 3600
+START = 1577836800  # 2020-01-01
+
+
+def histo(start, n):
+    """ Return n hourly candles from start as CryptoCompare returns them
+    """
+    times = range(start, start + n * HOUR, HOUR)
+    return pd.DataFrame({
+        'time': list(times),
+        'high': [7100.5 + i for i in range(n)],
+        'low': [6900.0 + i for i in range(n)],
+        'open': [7000.0 + i for i in range(n)],
+        'volumefrom': [10.0 + i for i in range(n)],
+        'volumeto': [70000 + i for i in range(n)],
+        'close': [7050.25 + i for i in range(n)],
+        'conversionType': ['direct'] * n,
+        'conversionSymbol': ['' if i % 3 else 'BTC' for i in range(n)]})
+
+
+class HistoAPI:
+    """ CryptoCompareAPI stand-in serving histo(START, ...) candles
+    """
+
+    def __init__(self, n):
+        self.n = n
+
+    def getHistoData(self, fsym, tsym, freq, e='CCCAGG', start_time=None,
+                     end_time=None, max_workers=None):
+        return histo(START, self.n)
+
+    def _freqSeconds(self, freq):
+        return HOUR
+
+
+def assert_cache_hit_equals_parse(csvpath):
+    hit = read_cache(str(csvpath))
+    assert hit is not None
+    shutil.rmtree(cache_dir(str(csvpath)))
+    parsed = read_ohlcv(str(csvpath))  # cache miss, parsed from the CSV
+    pd.testing.assert_frame_equal(hit, parsed)
+    pd.testing.assert_frame_equal(read_ohlcv(str(csvpath)), parsed)
+
+
+def test_fetched_file_cache_equals_csv_parse(fetcher, tmp_path):
+    toplist = pd.DataFrame({'FROMSYMBOL': ['BTC'], 'TOSYMBOL': ['USDT']})
+    result = fetcher.fetchTopListHisto(HistoAPI(50), toplist, '1h',
+                                       None, None, str(tmp_path))
+    assert list(result['rows']) == [50]
+    assert_cache_hit_equals_parse(tmp_path / 'BTC_USDT_1h.csv')
+
+
+def test_synced_file_cache_equals_csv_parse(fetcher, tmp_path):
+    csvpath = tmp_path / 'BTC_USDT_1h.csv'
+    fetcher.cc2bt(histo(START, 30)).to_csv(csvpath, index=False,
+                                           date_format=fetcher.DATE_FMT)
+    read_ohlcv(str(csvpath))
+    assert fetcher.syncHistoCsv(HistoAPI(50), str(csvpath), 'BTC', 'USDT',
+                                '1h') == 20
+    assert_cache_hit_equals_parse(csvpath)
+
+
+def test_write_cache_index_col_drops_the_column(tmp_path):
+    csvpath = tmp_path / 'x.csv'
+    data = pd.DataFrame({'close': [1.0, 2.0],
+                         'datetime': ['2020-01-01 00:00:00',
+                                      '2020-01-01 01:00:00']})
+    data.to_csv(csvpath, index=False)
+    write_cache(data, str(csvpath), index_col='datetime')
+    assert list(read_cache(str(csvpath)).columns) == ['close']
+
+
+def assert_pyramid_equals_aggregates(csvpath):
+    base = read_ohlcv(str(csvpath))
+    for timeframe in PYRAMID:
+        pd.testing.assert_frame_equal(read_timeframe(str(csvpath), timeframe),
+                                      aggregate(base, timeframe),
+                                      check_freq=False)
+
+
+@pytest.mark.parametrize('rewrite', [
+    lambda data: data.assign(close=data['close'] * 2),  # grown, other bars
+    lambda data: data.iloc[:80],                        # shrunk
+    lambda data: data.iloc[24:]],                       # other first bar
+    ids=['doubled_close', 'shrunk', 'later_start'])
+def test_pyramid_of_rewritten_csv(fetcher, tmp_path, rewrite):
+    csvpath = tmp_path / 'BTC_USDT_1h.csv'
+    data = fetcher.cc2bt(histo(START, 200))
+    data.iloc[:100].to_csv(csvpath, index=False, date_format=fetcher.DATE_FMT)
+    assert_pyramid_equals_aggregates(csvpath)
+
+    rewrite(data.iloc[:120]).to_csv(csvpath, index=False,
+                                    date_format=fetcher.DATE_FMT)
+    assert_pyramid_equals_aggregates(csvpath)
+
+
+def test_pyramid_of_appended_csv(fetcher, tmp_path):
+    csvpath = tmp_path / 'BTC_USDT_1h.csv'
+    fetcher.cc2bt(histo(START, 30)).to_csv(csvpath, index=False,
+                                           date_format=fetcher.DATE_FMT)
+    assert_pyramid_equals_aggregates(csvpath)
+    assert fetcher.syncHistoCsv(HistoAPI(50), str(csvpath), 'BTC', 'USDT',
+                                '1h') == 20
+    assert_pyramid_equals_aggregates(csvpath)
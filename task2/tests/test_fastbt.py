@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import fastbt
+from conftest import TASK2
+from datacache import read_ohlcv
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_ohlcv(os.path.join(TASK2, 'data', 'BTC_USDT_1h.csv'))
+
+
+@pytest.mark.parametrize('kind, pfast, pslow', [
+    ('sma', 10, 20),
+    ('sma', 50, 200),
+    ('ema', 20, 50),
+    ('sma', 15, 15),  # fast == slow never crosses, no trades at all
+    ('ema', 5, 2100),  # slow warms up near the end, no trades at all
+])
+def test_kernel_matches_cerebro(data, kind, pfast, pslow):
+    (fast_value, fast_closed), (full_value, full_closed) = \
+        fastbt.check_against_cerebro(data, pfast, pslow, kind)
+    assert fast_closed == full_closed
+    assert fast_value == pytest.approx(full_value, rel=1e-9)
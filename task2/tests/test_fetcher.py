@@ -0,0 +1,146 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+import pytest
+
+HOUR = 3600
+FIRST = 1546300800  # 2019-01-01, the first candle the stub server has
+LAST = 1577836800  # 2020-01-01
+
+
+class HistoHourHandler(BaseHTTPRequestHandler):
+    """ CryptoCompare histohour stub: limit + 1 candles up to toTs, none
+    before FIRST
+    """
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        to_ts = int(query['toTs'][0]) // HOUR * HOUR
+        limit = int(query['limit'][0])
+        times = range(max(FIRST, to_ts - limit * HOUR), to_ts + HOUR, HOUR)
+        data = [{'time': t, 'close': t / HOUR, 'high': t / HOUR + 1,
+                 'low': t / HOUR - 1, 'open': t / HOUR, 'volumefrom': 1.0,
+                 'volumeto': 2.0} for t in times if t <= LAST]
+        body = json.dumps({'Response': 'Success', 'Data': data}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), HistoHourHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def api(fetcher, server):
+    api = fetcher.CryptoCompareAPI(rate_limit=1000)
+    api.url = server
+    return api
+
+
+@pytest.mark.parametrize('start_time, end_time', [
+    ('2019-03-01', '2019-03-02'),  # within one page
+    ('2019-02-01', '2019-09-01'),  # several pages
+    ('2018-06-01', '2019-09-01'),  # starts before the first candle
+])
+def test_concurrent_pages_equal_serial(api, start_time, end_time):
+    serial = api.getHistoData('BTC', 'USDT', '1h', start_time=start_time,
+                              end_time=end_time)
+    concurrent = api.getHistoData('BTC', 'USDT', '1h', start_time=start_time,
+                                  end_time=end_time, max_workers=4)
+    assert serial.equals(concurrent)
+    # every candle from start_time (or the first one) to end_time, once
+    start = max(FIRST, int(pd.Timestamp(start_time).timestamp()))
+    end = int(pd.Timestamp(end_time).timestamp())
+    assert list(serial['time']) == list(range(start, end + HOUR, HOUR))
+
+
+class FirstFetchAPI:
+    """ CryptoCompareAPI stand-in recording the requested start_time
+    """
+
+    start_time = None
+
+    def getHistoData(self, fsym, tsym, freq, e='CCCAGG', start_time=None,
+                     end_time=None, max_workers=None):
+        self.start_time = start_time
+        return pd.DataFrame({'time': [FIRST, FIRST + HOUR], 'close': 1.0,
+                             'high': 2.0, 'low': 0.5, 'open': 1.5,
+                             'volumefrom': 10.0, 'volumeto': 15.0})
+
+    def _freqSeconds(self, freq):
+        return HOUR
+
+
+@pytest.mark.parametrize('text', ['', '\n', '\r\n\r\n'])
+def test_sync_header_only_csv_fetches_everything(fetcher, tmp_path, text):
+    # e.g. left behind by an interrupted first fetch
+    header = 'close,high,low,open,volume,baseVolume,datetime'
+    csvpath = str(tmp_path / 'BTC_USDT_1h.csv')
+    with open(csvpath, 'w') as f:
+        f.write(header + '\n' + text)
+    assert fetcher.readLastRow(csvpath) == (header.split(','), None)
+
+    api = FirstFetchAPI()
+    assert fetcher.syncHistoCsv(api, csvpath, 'BTC', 'USDT', '1h') == 2
+    assert api.start_time == fetcher.HISTORY_START
+    data = pd.read_csv(csvpath)
+    assert list(data.columns) == header.split(',')
+    assert list(data['datetime']) == ['2019-01-01 00:00:00',
+                                      '2019-01-01 01:00:00']
+
+
+def cc2bt_unix2date(fetcher, df):
+    """ cc2bt as it was before vectorizing, a string per row by unix2date
+    """
+    df['datetime'] = df['time'].apply(fetcher.unix2date)
+    df.drop(columns=['time'], inplace=True)
+    df.rename(columns={'volumefrom': 'volume',
+                       'volumeto': 'baseVolume'}, inplace=True)
+    return df
+
+
+def test_cc2bt_csv_equals_unix2date_csv(fetcher, tmp_path):
+    times = [0, 951782400, 1562554800, 1562554859, FIRST, LAST, 2147483648,
+             4102444799]  # epoch, leap day, odd seconds, past 2038
+    raw = pd.DataFrame({'time': times,
+                        'close': [7050.25 + i for i in range(len(times))],
+                        'high': [7100.5] * len(times),
+                        'low': [1e-8] * len(times),
+                        'open': [7000.0] * len(times),
+                        'volumefrom': list(range(len(times))),
+                        'volumeto': [70000.25] * len(times)})
+    old, new = tmp_path / 'old.csv', tmp_path / 'new.csv'
+    cc2bt_unix2date(fetcher, raw.copy()).to_csv(
+        old, index=False, date_format=fetcher.DATE_FMT)
+    fetcher.cc2bt(raw.copy()).to_csv(new, index=False,
+                                     date_format=fetcher.DATE_FMT)
+    assert new.read_bytes() == old.read_bytes()
+
+    # the rows syncHistoCsv appends, without header
+    header = list(fetcher.cc2bt(raw.copy()).columns)
+    assert (fetcher.cc2bt(raw.copy())[header].to_csv(
+                header=False, index=False, date_format=fetcher.DATE_FMT)
+            == cc2bt_unix2date(fetcher, raw.copy())[header].to_csv(
+                header=False, index=False))
+
+    # parsed back the times are the epoch seconds, written again the same
+    parsed = pd.read_csv(new, index_col='datetime', parse_dates=True)
+    assert list(parsed.index.asi8 // 10**9) == times
+    text = parsed.reset_index()[header].to_csv(index=False,
+                                               date_format=fetcher.DATE_FMT)
+    assert text.encode() == new.read_bytes()
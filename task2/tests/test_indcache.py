@@ -0,0 +1,116 @@
+import os
+
+import backtrader as bt
+import backtrader.feeds as btfeeds
+import backtrader.indicators as btind
+import numpy as np
+import pytest
+
+from conftest import TASK2
+from datacache import read_ohlcv
+from strategies.indcache import IndicatorCache, cached, indicator_cache
+
+
+class RecordLines(bt.Strategy):
+    ''' Record the lines of cached indicators next to fresh ones
+    '''
+    params = (
+        ('period', 20),
+    )
+
+    def __init__(self):
+        self.pairs = [
+            (cached(btind.SMA)(self.data, period=self.p.period),
+             btind.SMA(self.data, period=self.p.period)),
+            (cached(btind.Ichimoku)(self.data), btind.Ichimoku(self.data)),
+        ]
+        self.rows = []
+
+    def next(self):
+        self.rows.append([(tuple(line[0] for line in cache.lines),
+                           tuple(line[0] for line in fresh.lines))
+                          for cache, fresh in self.pairs])
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_ohlcv(os.path.join(TASK2, 'data', 'BTC_USDT_1h.csv'))
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    indicator_cache.clear()
+    yield
+    indicator_cache.clear()
+
+
+def run(data, runonce=True, **params):
+    cerebro = bt.Cerebro(runonce=runonce, stdstats=False)
+    cerebro.adddata(btfeeds.PandasData(dataname=data))
+    cerebro.addstrategy(RecordLines, **params)
+    return cerebro.run()[0].rows
+
+
+def assert_same_lines(rows, other=None):
+    """ Assert the cached lines of rows equal the fresh ones, or the cached
+    ones of other
+    """
+    assert rows
+    for i, row in enumerate(rows):
+        for j, (cache, fresh) in enumerate(row):
+            expected = fresh if other is None else other[i][j][0]
+            np.testing.assert_array_equal(cache, expected)
+
+
+def test_hit_returns_the_fresh_lines(data):
+    first = run(data)
+    assert len(indicator_cache) == 2
+    hits, misses = indicator_cache.hits, indicator_cache.misses
+    second = run(data)
+    assert indicator_cache.hits == hits + 2
+    assert indicator_cache.misses == misses
+    assert_same_lines(first)
+    assert_same_lines(second)
+    assert_same_lines(second, first)
+
+
+def test_next_mode_bypasses_the_cache(data):
+    run(data)
+    hits, misses = indicator_cache.hits, indicator_cache.misses
+    # runonce fills the cache, bar by bar the lines are computed afresh
+    assert_same_lines(run(data, runonce=False))
+    assert (indicator_cache.hits, indicator_cache.misses) == (hits, misses)
+    assert len(indicator_cache) == 2
+
+
+def test_other_feed_or_params_miss(data):
+    run(data)
+    misses = indicator_cache.misses
+
+    # one changed close changes the fingerprint of the feed
+    other = data.copy()
+    other.iloc[1000, other.columns.get_loc('close')] *= 1.01
+    assert_same_lines(run(other))
+    assert indicator_cache.misses == misses + 2
+    assert len(indicator_cache) == 4
+
+    assert_same_lines(run(data, period=30))
+    assert indicator_cache.misses == misses + 3  # Ichimoku hits
+    assert len(indicator_cache) == 5
+
+
+def test_lru_eviction():
+    cache = IndicatorCache(maxbytes=3 * 80)
+    arrays = {key: [np.zeros(10)] for key in 'abcd'}  # 80 bytes each
+    for key in 'abc':
+        cache.put(key, [1], arrays[key])
+    assert cache.nbytes == 240
+    assert cache.get('a') is not None  # a is now the most recent
+    cache.put('d', [1], arrays['d'])
+    assert cache.get('b') is None  # least recently used, evicted
+    assert [cache.get(key) is not None for key in 'acd'] == [True] * 3
+    assert cache.nbytes == 240
+
+    cache.put('big', [1], [np.zeros(31)])  # over maxbytes, not stored
+    assert cache.get('big') is None
+    assert len(cache) == 3
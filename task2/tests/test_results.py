@@ -0,0 +1,37 @@
+import sqlite3
+
+from results import ResultStore, SCHEMA
+from strategies.SMACross import SMACross
+
+KPIS = {'sharpe_ratio': 1.0}
+
+
+def test_lookup_misses_after_data_file_changed(tmp_path):
+    csvpath = tmp_path / 'BTC_USDT_1h.csv'
+    csvpath.write_text('close,datetime\n1.0,2020-01-01 00:00:00\n')
+    with ResultStore(str(tmp_path / 'results.sqlite'), str(tmp_path)) as store:
+        args = ('BTC_USDT_1h.csv', SMACross, {'pfast': 5}, '2020-01-01', '')
+        store.save(*args, 101.0, KPIS)
+        assert store.lookup(*args)['final_value'] == 101.0
+
+        # data-fetcher.py sync appends candles
+        with open(csvpath, 'a') as f:
+            f.write('2.0,2020-01-01 01:00:00\n')
+        assert store.lookup(*args) is None
+
+        store.save(*args, 102.0, KPIS)
+        assert store.lookup(*args)['final_value'] == 102.0
+        assert len(store.query()) == 1
+
+
+def test_store_without_data_stamp_is_upgraded(tmp_path):
+    dbfile = str(tmp_path / 'results.sqlite')
+    conn = sqlite3.connect(dbfile)
+    conn.executescript(SCHEMA.replace(
+        "    data_stamp TEXT NOT NULL DEFAULT '',\n", ''))
+    conn.close()
+    with ResultStore(dbfile, str(tmp_path)) as store:
+        args = ('missing.csv', SMACross, None, '2020-01-01', '')
+        assert store.lookup(*args) is None
+        store.save(*args, 100.0, KPIS)
+        assert store.lookup(*args)['final_value'] == 100.0
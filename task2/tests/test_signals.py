@@ -0,0 +1,108 @@
+import os
+import math
+
+import backtrader as bt
+import backtrader.feeds as btfeeds
+import backtrader.indicators as btind
+import pytest
+
+from conftest import TASK2
+from datacache import read_ohlcv
+from strategies.signals import FWRSignal, IchimokuSignal
+
+
+class RecordSignals(bt.Strategy):
+    ''' Record the signal lines of every bar next to the per bar expressions
+    FWR and IchimokuStrat evaluated before the signals were precomputed
+    '''
+
+    def __init__(self):
+        self.fwr = FWRSignal(self.data)
+        self.ichimoku = btind.Ichimoku(self.data)
+        self.ich = IchimokuSignal(self.data, self.ichimoku)
+        self.rows = []
+
+    def _fwr_reference(self):
+        high, low, dt = self.data.high, self.data.low, self.data.datetime
+        if len(self) < 5:
+            return None  # looked past the first bar, now 0.0 by definition
+        buy = ((dt[0] > dt[-4]) & (high[-3] > high[-4])
+               & (high[-2] > high[-3]) & (high[-1] > high[-2])
+               & (high[0] > high[-1]))
+        sell = ((dt[0] > dt[-4]) & (low[-3] < low[-4])
+                & (low[-2] < low[-3]) & (low[-1] < low[-2])
+                & (low[0] < low[-1]))
+        return float(buy), float(sell)
+
+    def _ichimoku_reference(self):
+        close = self.data.close[0]
+        span_a = self.ichimoku.senkou_span_a[0]
+        span_b = self.ichimoku.senkou_span_b[0]
+        kijun = self.ichimoku.kijun_sen[0]
+        buy = (close > span_b) & (span_a > span_b) & (close > kijun)
+        sell = (close < span_a) & (span_a < span_b) & (close < kijun)
+        return float(buy), float(sell)
+
+    def prenext(self):
+        # before the Ichimoku minperiod only FWRSignal has values
+        self.rows.append(((self.fwr.buy[0], self.fwr.sell[0]),
+                          self._fwr_reference(), None, None))
+
+    def next(self):
+        self.rows.append(((self.fwr.buy[0], self.fwr.sell[0]),
+                          self._fwr_reference(),
+                          (self.ich.buy[0], self.ich.sell[0]),
+                          self._ichimoku_reference()))
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_ohlcv(os.path.join(TASK2, 'data', 'BTC_USDT_1h.csv'))
+
+
+def record(data, runonce):
+    cerebro = bt.Cerebro(runonce=runonce, stdstats=False)
+    cerebro.adddata(btfeeds.PandasData(dataname=data))
+    cerebro.addstrategy(RecordSignals)
+    return cerebro.run()[0].rows
+
+
+@pytest.fixture(scope='module')
+def rows(data):
+    return {runonce: record(data, runonce) for runonce in (True, False)}
+
+
+def test_runonce_equals_next(rows, data):
+    assert len(rows[True]) == len(rows[False]) == len(data)
+    # the signals are 0.0 or 1.0, never NaN, so == compares every bar
+    assert ([row[0] for row in rows[True]]
+            == [row[0] for row in rows[False]])
+    assert ([row[2] for row in rows[True]]
+            == [row[2] for row in rows[False]])
+
+
+@pytest.mark.parametrize('runonce', [True, False])
+def test_fwr_signal_equals_original(rows, runonce):
+    compared = 0
+    for signal, reference, _, _ in rows[runonce]:
+        if reference is None:
+            assert signal == (0.0, 0.0)
+        else:
+            assert signal == reference
+            compared += 1
+    assert compared == len(rows[runonce]) - 4
+    assert any(signal[0] for signal, _, _, _ in rows[runonce])
+    assert any(signal[1] for signal, _, _, _ in rows[runonce])
+
+
+@pytest.mark.parametrize('runonce', [True, False])
+def test_ichimoku_signal_equals_original(rows, runonce):
+    compared = [(signal, reference)
+                for _, _, signal, reference in rows[runonce]
+                if signal is not None]
+    assert compared
+    for signal, reference in compared:
+        assert not any(math.isnan(value) for value in signal)
+        assert signal == reference
+    assert any(signal[0] for signal, _ in compared)
+    assert any(signal[1] for signal, _ in compared)
@@ -1,4 +1,10 @@
 import os
+import sys
+import queue
+import logging
+import logging.handlers
+import importlib.util
+from contextlib import contextmanager
 from datetime import datetime
 
 
@@ -20,3 +26,55 @@ def dir_exists(foldername):
     """ Return True if folder exists, else False
     """
     return os.path.isdir(foldername)
+
+
+def setup_logging(level=logging.INFO, logfile=None, name='strategies'):
+    """ Route records of logger name (the strategies) through a queue to a
+    background thread writing to stdout and optionally logfile.
+    Returns the listener, stop() it to flush before exit.
+
+    Records below level are dropped before any formatting, e.g. the per bar
+    'Close' lines are DEBUG.
+    """
+    records = queue.SimpleQueue()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if logfile:
+        handlers.append(logging.FileHandler(logfile))
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(records, *handlers)
+    logger = logging.getLogger(name)
+    logger.handlers = [logging.handlers.QueueHandler(records)]
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+@contextmanager
+def quiet_strategies(names=('strategies',)):
+    """ Drop the records of loggers names, by default the one of the
+    strategies, before they are formatted for the with block
+    """
+    loggers = [logging.getLogger(name) for name in names]
+    levels = [logger.level for logger in loggers]
+    for logger in loggers:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        for logger, level in zip(loggers, levels):
+            logger.setLevel(level)
+
+
+def load_script(name, path):
+    """ Return module of the script at path whose file name is not
+    importable, e.g. data-fetcher.py; registered in sys.modules as name,
+    where backtrader looks up the module of a strategy class
+    """
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    return sys.modules[name]
@@ -0,0 +1,132 @@
+import os
+import math
+import multiprocessing
+
+import pandas as pd
+
+from results import strategy_params
+from shareddata import SharedOHLCV
+from sweep import STRATEGIES, param_grid, _init_worker, _run_params
+from run import load_data, datafile, logdir, from_datetime, to_datetime
+
+
+def walk_forward_folds(index, insample, outsample, step=None, min_bars=0):
+    """ Return list of (in-sample from, out-of-sample from, out-of-sample to)
+    timestamps of rolling folds over datetime index, to excluded
+
+    insample, outsample, step: lengths as pd.Timedelta strings, e.g. '30D';
+    folds move forward by step, default outsample so that the out-of-sample
+    windows follow each other. Only complete folds are returned.
+    min_bars: raise ValueError if a window holds no more bars, e.g. the
+              longest indicator period, which would never produce a signal
+    """
+    insample, outsample = pd.Timedelta(insample), pd.Timedelta(outsample)
+    step = pd.Timedelta(step) if step is not None else outsample
+    end = index[-1] + pd.Timedelta(1, 'ns')
+    folds = []
+    start = index[0]
+    while start + insample + outsample <= end:
+        folds.append((start, start + insample, start + insample + outsample))
+        start += step
+    index = pd.DatetimeIndex(index)
+    for fold in folds:
+        bars = index.searchsorted(fold)
+        for window, start, nbars in (
+                ('in-sample', fold[0], bars[1] - bars[0]),
+                ('out-of-sample', fold[1], bars[2] - bars[1])):
+            if nbars <= min_bars:
+                raise ValueError('{} window from {} holds {} bars, needs '
+                                 'more than {}'.format(window, start, nbars,
+                                                       min_bars))
+    return folds
+
+
+def longest_period(strategy, grid):
+    """ Return the largest integer param of strategy over the params of
+    grid, taken as its longest indicator period, 0 without any
+    """
+    return max((value for params in grid
+                for value in strategy_params(strategy, params).values()
+                if isinstance(value, int) and not isinstance(value, bool)),
+               default=0)
+
+
+def _score(row, metric):
+    """ Return metric of a result row, undefined values rank last
+    """
+    value = row.get(metric)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return -math.inf
+    return value
+
+
+def walk_forward(strategy_name, grid, insample='30D', outsample='15D',
+                 step=None, metric='final_value', datafile=datafile,
+                 from_datetime=from_datetime, to_datetime=to_datetime,
+                 processes=None):
+    """ Optimize strategy_name over grid on each in-sample fold and run the
+    best params on the following out-of-sample window
+
+    All folds run in one process pool started once, whose workers attach
+    to the shared memory copy of the data loaded once; indicators are
+    computed per fold window. Out of sample runs start flat with fresh
+    indicators, without warm-up bars, so every window must hold more bars
+    than longest_period(), else ValueError is raised.
+    Return dataframe with one row per fold: its windows, the winning
+    params, their in-sample metric and the out-of-sample KPIs.
+    """
+    strategy = STRATEGIES[strategy_name]
+    unknown = set(grid) - set(strategy.params._getkeys())
+    if unknown:
+        raise ValueError('{} has no params {}'.format(
+            strategy_name, sorted(unknown)))
+    data = load_data(datafile, from_datetime, to_datetime)
+    grid = param_grid(grid)
+    folds = walk_forward_folds(data.index, insample, outsample, step,
+                               min_bars=longest_period(strategy, grid))
+    processes = processes or os.cpu_count()
+    with SharedOHLCV.from_frame(data) as shared, \
+            multiprocessing.Pool(processes=processes,
+                                 initializer=_init_worker,
+                                 initargs=(shared.descriptor,)) as pool:
+        # in-sample runs of every fold at once, to keep the pool busy
+        jobs = [(strategy_name, params, (is_from, oos_from), False)
+                for is_from, oos_from, _ in folds for params in grid]
+        chunksize = max(1, len(jobs) // (4 * processes))
+        insample_rows = [row for _, row, _ in
+                         pool.imap(_run_params, jobs, chunksize)]
+        best = []
+        for i in range(len(folds)):
+            rows = insample_rows[i * len(grid):(i + 1) * len(grid)]
+            best.append(max(zip(grid, rows),
+                            key=lambda pr: _score(pr[1], metric)))
+        jobs = [(strategy_name, params, (oos_from, oos_to), False)
+                for (_, oos_from, oos_to), (params, _) in zip(folds, best)]
+        oos_rows = [row for _, row, _ in pool.map(_run_params, jobs)]
+    results = []
+    for (is_from, oos_from, oos_to), (params, is_row), oos_row in zip(
+            folds, best, oos_rows):
+        row = {'insample_from': is_from, 'outsample_from': oos_from,
+               'outsample_to': oos_to, **params,
+               'insample_' + metric: is_row.get(metric)}
+        row.update({k: v for k, v in oos_row.items()
+                    if k not in params and k != 'strategy'})
+        results.append(row)
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    strategy_name = 'SMACross'
+    grid = {'pfast': range(5, 30, 5),
+            'pslow': range(20, 100, 10)}
+
+    results = walk_forward(strategy_name, grid, insample='30D',
+                           outsample='15D')
+    resfile = '_'.join([
+        os.path.splitext(datafile)[0], strategy_name, 'walkforward',
+        from_datetime.split(" ")[0], to_datetime.split(" ")[0]])
+    results.to_csv(os.path.join(logdir, resfile + '.csv'), index=False)
+    print(results.to_string(index=False))
+    # out-of-sample windows follow each other, their returns compound
+    growth = (results['final_value'] / results['start_cash']).prod()
+    print('Out-of-sample total return: %.2f%%' % (100 * (growth - 1)))
@@ -0,0 +1,114 @@
+import datetime
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class WriterColumnar(bt.WriterBase):
+    ''' Columnar replacement of bt.WriterFile(csv=True)
+
+    Collects the per bar values cerebro hands to csv writers (data feeds,
+    strategy, Broker, BuySell, Trades ...) into a preallocated float64
+    array and writes it once in stop(), instead of formatting a text row per
+    bar. Columns are named segment.line, e.g. data0.close, Broker.value,
+    BuySell.buy; data feeds without a name are called data0, data1, ...
+
+    Params:
+      - out: output file, Parquet if it ends with .parquet, else NPZ
+      - lines: iterable of segments ('Broker') and/or columns
+        ('BuySell.buy') to keep, None keeps every line
+      - capacity: initial number of rows, doubled when full
+    '''
+    params = (
+        ('out', None),
+        ('lines', None),
+        ('capacity', 4096),
+        ('csv', True),  # ask cerebro for the values, as WriterFile does
+    )
+
+    def __init__(self):
+        self.headers = list()
+        self.columns = list()
+        self._keep = list()
+        self._dtcols = set()
+        self._rows = None
+        self._n = 0
+
+    def addheaders(self, headers):
+        self.headers.extend(headers)
+
+    def _select(self):
+        ''' Resolve column names and the value positions to keep'''
+        wanted = set(self.p.lines) if self.p.lines is not None else None
+        ndata = 0
+        segment, start = None, None
+        headers = self.headers + [None]
+        for i, header in enumerate(self.headers):
+            if headers[i + 1] == 'len':
+                # a segment starts with its name, followed by len
+                segment, start = header, i
+                if not segment:
+                    segment = 'data%d' % ndata
+                    ndata += 1
+                continue
+            if i == start + 1:
+                continue  # len
+            column = '{}.{}'.format(segment, header)
+            if wanted is None or segment in wanted or column in wanted:
+                self.columns.append(column)
+                self._keep.append(i)
+
+    def start(self):
+        self._select()
+        self._rows = np.full((self.p.capacity, len(self.columns)), np.nan)
+
+    def addvalues(self, values):
+        if self._n == len(self._rows):
+            self._rows = np.concatenate(
+                [self._rows, np.full_like(self._rows, np.nan)])
+        row = self._rows[self._n]
+        for j, i in enumerate(self._keep):
+            value = values[i]
+            if value == '':
+                continue  # no value yet, stays NaN
+            if isinstance(value, datetime.datetime):
+                self._dtcols.add(j)
+                value = (value - _EPOCH).total_seconds()
+            row[j] = value
+        self._n += 1
+
+    def next(self):
+        pass  # values are stored by addvalues, nothing to format per bar
+
+    def writedict(self, dct):
+        pass  # the Cerebro summary is not tabular, see WriterFile for it
+
+    def frame(self):
+        ''' Return the collected lines as dataframe, datetimes as datetime64'''
+        data = pd.DataFrame(self._rows[:self._n], columns=self.columns)
+        for j in sorted(self._dtcols):
+            col = self.columns[j]
+            us = np.rint(data[col].to_numpy() * 1e6)
+            data[col] = pd.to_datetime(us, unit='us')
+        return data
+
+    def stop(self):
+        if self.p.out is None:
+            return
+        data = self.frame()
+        if self.p.out.endswith('.parquet'):
+            data.to_parquet(self.p.out, index=False)
+        else:
+            np.savez(self.p.out, **{col: data[col].to_numpy()
+                                    for col in data.columns})
+
+
+def read_columnar(filename):
+    ''' Return dataframe of a file written by WriterColumnar'''
+    if filename.endswith('.parquet'):
+        return pd.read_parquet(filename)
+    with np.load(filename) as npz:
+        return pd.DataFrame({col: npz[col] for col in npz.files})